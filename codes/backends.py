@@ -0,0 +1,79 @@
+from difflib import SequenceMatcher
+
+from django.conf import settings
+
+from . import metrics
+from .parallel import compare_pairs
+
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:
+    fuzz = process = None
+
+# По умолчанию difflib: его оценки записаны в уже сохранённых результатах.
+# RapidFuzz ('rapidfuzz') быстрее, но оценивает немного иначе — включается явно
+SIMILARITY_BACKEND = getattr(settings, 'PLAGIARISM_SIMILARITY_BACKEND', 'difflib')
+WORKERS = getattr(settings, 'PLAGIARISM_WORKERS', -1)
+
+
+class DifflibBackend:
+    # Эталонная реализация на чистом Python, пары раздаются пулу процессов
+    name = 'difflib'
+
+    def ratio(self, text1, text2):
+        with metrics.timed('similarity_metric', metric='difflib'):
+            return SequenceMatcher(None, text1, text2).ratio() * 100
+
+    def ratios(self, texts, pairs):
+        return dict(compare_pairs(texts, pairs, prepare=str, compare=difflib_ratio))
+
+    def matrix(self, texts):
+        size = len(texts)
+        ratios = self.ratios(dict(enumerate(texts)), [(i, j) for i in range(size) for j in range(i + 1, size)])
+        return [[100.0 if i == j else ratios[min(i, j), max(i, j)] for j in range(size)] for i in range(size)]
+
+
+class RapidFuzzBackend:
+    # fuzz.ratio — нормированное Indel-расстояние (2·LCS / сумма длин), та же шкала 0–100, что у difflib;
+    # difflib ищет совпадения эвристически, поэтому его оценка бывает немного ниже
+    name = 'rapidfuzz'
+    # Доля заполненности матрицы, начиная с которой выгоднее считать её целиком через cdist
+    DENSE_RATIO = 0.25
+
+    def ratio(self, text1, text2):
+        with metrics.timed('similarity_metric', metric='rapidfuzz'):
+            return fuzz.ratio(text1, text2)
+
+    def ratios(self, texts, pairs):
+        pairs = list(pairs)
+        ids = sorted({obj_id for pair in pairs for obj_id in pair})
+        if len(pairs) < self.DENSE_RATIO * len(ids) ** 2 / 2:
+            return {(id1, id2): self.ratio(texts[id1], texts[id2]) for id1, id2 in pairs}
+
+        index = {obj_id: i for i, obj_id in enumerate(ids)}
+        with metrics.timed('similarity_metric', metric='rapidfuzz_cdist'):
+            matrix = self.matrix([texts[obj_id] for obj_id in ids])
+        return {(id1, id2): float(matrix[index[id1], index[id2]]) for id1, id2 in pairs}
+
+    def matrix(self, texts):
+        # Вся матрица в нативном коде, строки распределяются по потокам
+        return process.cdist(texts, texts, scorer=fuzz.ratio, workers=WORKERS)
+
+
+BACKENDS = {
+    'difflib': DifflibBackend,
+    'rapidfuzz': RapidFuzzBackend,
+}
+
+
+def difflib_ratio(text1, text2):
+    return DifflibBackend().ratio(text1, text2)
+
+
+def get_backend(name=None):
+    name = name or SIMILARITY_BACKEND
+    if name == 'auto':
+        name = 'difflib'  # прежнее значение настройки
+    if name == 'rapidfuzz' and fuzz is None:
+        raise ImportError("RapidFuzz is not installed")
+    return BACKENDS[name]()
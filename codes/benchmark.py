@@ -0,0 +1,160 @@
+import time
+import random
+import statistics
+from itertools import combinations
+
+from .backends import BACKENDS, get_backend
+from .similarity import (build_artifact, compare_structure, compare_trees, jaccard_similarity, lcs_length,
+                         normalize_code_with_ast)
+
+NAMES = ['total', 'count', 'items', 'value', 'result', 'index', 'data', 'left', 'right', 'step']
+
+
+def python_function(rng, number, lines):
+    body = [f"def func_{number}({rng.choice(NAMES)}, {rng.choice(NAMES)}):", "    acc = 0"]
+    while len(body) < lines - 1:
+        name = rng.choice(NAMES)
+        body.extend(rng.choice([
+            [f"    for {name} in range({rng.randint(1, 100)}):", f"        acc += {name} * {rng.randint(1, 9)}"],
+            [f"    if acc > {rng.randint(10, 1000)}:", f"        acc -= {rng.randint(1, 9)}"],
+            [f"    {name} = acc // {rng.randint(2, 9)}"],
+            [f"    print({name}, acc)"],
+        ]))
+    body.append("    return acc")
+    return '\n'.join(body)
+
+
+def c_function(rng, number, lines):
+    body = [f"int func_{number}(int {rng.choice(NAMES)}, int {rng.choice(NAMES)}) {{", "    int acc = 0;"]
+    while len(body) < lines - 1:
+        name = rng.choice(NAMES)
+        body.append(rng.choice([
+            f"    for (int {name} = 0; {name} < {rng.randint(1, 100)}; {name}++) acc += {name} * {rng.randint(1, 9)};",
+            f"    if (acc > {rng.randint(10, 1000)}) acc -= {rng.randint(1, 9)};",
+            f"    int {name}_{len(body)} = acc / {rng.randint(2, 9)};",
+            f"    printf(\"%d\\n\", acc);",
+        ]))
+    body.append("    return acc;\n}")
+    return '\n'.join(body)
+
+
+def java_function(rng, number, lines):
+    return '\n'.join('    ' + line for line in c_function(rng, number, lines).replace(
+        'int func_', 'public static int func_').replace('printf("%d\\n", acc)', 'System.out.println(acc)').split('\n'))
+
+
+LANGUAGES = {
+    'python': python_function,
+    'c': c_function,
+    'java': java_function,
+}
+
+
+def generate_code(rng, language, lines):
+    code = '\n\n'.join(LANGUAGES[language](rng, number, 10) for number in range(max(1, lines // 11)))
+    return f"public class Main {{\n{code}\n}}" if language == 'java' else code
+
+
+def plagiarize(rng, code):
+    # Типичная маскировка списывания: переименование переменных, перестановка функций, комментарии
+    renamed = dict(zip(NAMES, rng.sample(NAMES, len(NAMES))))
+    code = ' '.join(renamed.get(word, word) for word in code.split(' '))
+    blocks = code.split('\n\n')
+    rng.shuffle(blocks)
+    comment = '#' if 'def ' in code else '//'
+    return '\n\n'.join(f"{comment} part {i}\n{block}" for i, block in enumerate(blocks))
+
+
+def generate_corpus(count, lines=200, languages=('python',), plagiarism_rate=0.1, seed=0):
+    # Работы с заданной долей списанных: source — индекс исходной работы (None для оригинальных)
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(count):
+        originals = [i for i, item in enumerate(corpus) if item['source'] is None]
+        if originals and rng.random() < plagiarism_rate:
+            source = rng.choice(originals)
+            corpus.append({**corpus[source], 'code': plagiarize(rng, corpus[source]['code']), 'source': source})
+        else:
+            language = languages[index % len(languages)]
+            corpus.append({'language': language, 'code': generate_code(rng, language, lines), 'source': None})
+    return corpus
+
+
+def generate_submissions(count, lines=200, seed=0):
+    # Синтетические работы на Python примерно по lines строк, функции по 10 строк
+    rng = random.Random(seed)
+    return ['\n\n'.join(python_function(rng, number, 10) for number in range(max(1, lines // 11)))
+            for _ in range(count)]
+
+
+# Замеры
+def time_median(func, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def sample_pairs(count, limit, seed=0):
+    # Случайные пары i < j без списка всех n·(n−1)/2 пар (при n = 5000 это 12,5 млн кортежей)
+    if count * (count - 1) // 2 <= limit:
+        return list(combinations(range(count), 2))
+    rng = random.Random(seed)
+    pairs = set()
+    while len(pairs) < limit:
+        i, j = rng.sample(range(count), 2)
+        pairs.add((min(i, j), max(i, j)))
+    return sorted(pairs)
+
+
+def metric_benchmarks(codes, sample=200, repeat=3, seed=0):
+    # Время метрик на выборке пар; seconds — на одну пару, estimated_all_pairs — на все n·(n−1)/2 пар
+    pairs = sample_pairs(len(codes), sample, seed)
+    artifacts = [build_artifact(code) for code in codes]
+    for artifact in artifacts:
+        artifact.token_set, artifact.subtrees  # кэшируемые свойства считаются до замеров
+    trees = [normalize_code_with_ast(code) for code in codes]
+    metrics = {
+        'lcs_length': lambda i, j: lcs_length(artifacts[i].tokens, artifacts[j].tokens),
+        'compare_trees': lambda i, j: compare_trees(trees[i], trees[j]),
+        'jaccard_similarity': lambda i, j: jaccard_similarity(artifacts[i].token_set, artifacts[j].token_set),
+        'compare_structure': lambda i, j: compare_structure(artifacts[i], artifacts[j]),
+    }
+    for name in BACKENDS:
+        try:
+            backend = get_backend(name)
+        except ImportError:
+            continue
+        metrics[name] = lambda i, j, backend=backend: backend.ratio(codes[i], codes[j])
+
+    n = len(codes)
+    records = [{
+        'benchmark': 'metric.preprocess',
+        'n': n,
+        'seconds': time_median(lambda: [build_artifact(code) for code in codes], repeat) / n,
+    }]
+    for name, metric in metrics.items():
+        seconds = time_median(lambda: [metric(i, j) for i, j in pairs], repeat) / max(len(pairs), 1)
+        records.append({
+            'benchmark': f'metric.{name}',
+            'n': n,
+            'seconds': seconds,
+            'pairs_sampled': len(pairs),
+            'estimated_all_pairs': seconds * n * (n - 1) / 2,
+        })
+    return records
+
+
+def find_regressions(baseline, current, threshold=0.2):
+    # Замеры, ставшие медленнее базовых больше чем на threshold (0.2 — на 20 %)
+    previous = {(record['benchmark'], record['n']): record['seconds'] for record in baseline if 'seconds' in record}
+    regressions = []
+    for record in current:
+        if 'seconds' not in record:
+            continue  # показатели качества, а не времени
+        before = previous.get((record['benchmark'], record['n']))
+        if before and record['seconds'] > before * (1 + threshold):
+            regressions.append({**record, 'baseline_seconds': before, 'slowdown': record['seconds'] / before})
+    return regressions
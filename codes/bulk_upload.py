@@ -0,0 +1,134 @@
+import io
+import json
+import zlib
+import posixpath
+import zipfile
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import CodeBlob, User, Work
+
+BULK_MAX_ITEMS = getattr(settings, 'PLAGIARISM_BULK_MAX_ITEMS', 10000)
+BULK_MAX_FILE_SIZE = getattr(settings, 'PLAGIARISM_BULK_MAX_FILE_SIZE', 1024 * 1024)
+REQUIRED_FIELDS = ('user_name', 'work_number', 'code')
+
+
+class BulkUploadError(Exception):
+    pass
+
+
+# Разбор пакета: элементы — словари работ либо строка с ошибкой
+def parse_ndjson(lines):
+    # Одна работа на строку: {"user_name": ..., "work_number": ..., "code": ..., "email": ...}
+    items = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            item = 'Invalid JSON line'
+        items.append(item if isinstance(item, (dict, str)) else 'Expected a JSON object')
+        if len(items) > BULK_MAX_ITEMS:
+            raise BulkUploadError(f'Too many items (max {BULK_MAX_ITEMS})')
+    return items
+
+
+def parse_zip(data, work_number=''):
+    # Файлы архива: <work_number>/<user_name>.<ext>, либо <user_name>.<ext> при заданном work_number
+    try:
+        archive = zipfile.ZipFile(data if hasattr(data, 'read') else io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise BulkUploadError('Invalid zip archive')
+
+    items = []
+    with archive:
+        for info in archive.infolist():
+            name = info.filename
+            if info.is_dir() or is_service_file(name):
+                continue
+            if len(items) >= BULK_MAX_ITEMS:
+                raise BulkUploadError(f'Too many items (max {BULK_MAX_ITEMS})')
+            items.append(zip_item(archive, info, work_number))
+    return items
+
+
+def is_service_file(name):
+    # служебные файлы архиваторов и скрытые файлы
+    return name.startswith('__MACOSX/') or posixpath.basename(name).startswith('.')
+
+
+def split_entry_name(name, work_number=''):
+    # <work_number>/<user_name>.<ext> -> (user_name, work_number)
+    parts = name.split('/')
+    return posixpath.splitext(parts[-1])[0], parts[-2] if len(parts) > 1 else work_number
+
+
+def zip_item(archive, info, work_number):
+    user_name, number = split_entry_name(info.filename, work_number)
+    if not number:
+        return f'{info.filename}: work_number is not set'
+    if info.file_size > BULK_MAX_FILE_SIZE:
+        return f'{info.filename}: file is too large'
+    try:
+        code = archive.read(info).decode('utf-8')
+    except UnicodeDecodeError:
+        return f'{info.filename}: file is not UTF-8 text'
+    except RuntimeError:  # в том числе NotImplementedError для неподдерживаемого метода сжатия
+        return f'{info.filename}: file is encrypted' if info.flag_bits & 0x1 else f'{info.filename}: unsupported file'
+    except (zipfile.BadZipFile, zlib.error, EOFError):  # неверная CRC, повреждённые данные
+        return f'{info.filename}: file is damaged'
+    return {'user_name': user_name, 'work_number': number, 'code': code, 'file': info.filename}
+
+
+def validate(item):
+    if isinstance(item, str):
+        return item
+    missing = [field for field in REQUIRED_FIELDS if not isinstance(item.get(field), str) or not item[field]]
+    if missing:
+        return f'Missing or invalid fields: {", ".join(missing)}'
+    return None
+
+
+# Загрузка
+def resolve_users(items):
+    # Все пользователи пакета читаются одним запросом, недостающие создаются одной вставкой
+    emails = {}
+    for item in items:
+        emails.setdefault(item['user_name'], item.get('email', ''))
+    users = {user.username: user for user in User.objects.filter(username__in=emails)}
+    User.objects.bulk_create([User(username=name, email=email, password='default')
+                              for name, email in emails.items() if name not in users], ignore_conflicts=True)
+    if len(users) < len(emails):
+        users = {user.username: user for user in User.objects.filter(username__in=emails)}
+    return users
+
+
+def bulk_upload(items):
+    # Возвращает (статусы по элементам, созданные работы); некорректные элементы пропускаются.
+    # Отпечатки, MinHash и артефакты не строятся здесь: их пакетно строит воркер в задании сравнения
+    statuses = [None] * len(items)
+    valid = []
+    for i, item in enumerate(items):
+        error = validate(item)
+        if error:
+            statuses[i] = {'index': i, 'status': 'error', 'message': error}
+        else:
+            valid.append((i, item))
+
+    works = []
+    if valid:
+        with transaction.atomic():
+            users = resolve_users([item for _, item in valid])
+            works = [Work(user=users[item['user_name']], work_number=item['work_number'], code=item['code'])
+                     for _, item in valid]
+            CodeBlob.store(works)  # одинаковый код пакета записывается один раз
+            works = Work.objects.bulk_create(works, batch_size=500)
+
+    for (i, item), work in zip(valid, works):
+        statuses[i] = {'index': i, 'status': 'created', 'work_id': work.id}
+        if 'file' in item:
+            statuses[i]['file'] = item['file']
+    return statuses, works
@@ -0,0 +1,100 @@
+import zlib
+import struct
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import models
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 'auto' — zstd, если установлен zstandard, иначе zlib; 'none' — без сжатия
+CODE_COMPRESSION = getattr(settings, 'PLAGIARISM_CODE_COMPRESSION', 'auto')
+# Общие словари (файлы со стартовым кодом курса). Новые данные сжимаются последним,
+# старые словари нужны только для чтения: удалять их из списка нельзя, пока ими сжаты строки
+COMPRESSION_DICTIONARIES = getattr(settings, 'PLAGIARISM_COMPRESSION_DICTIONARIES', [])
+MIN_COMPRESS_SIZE = 64  # короткий код хранится как есть
+
+RAW, ZLIB, ZSTD = 0, 1, 2
+HEADER = struct.Struct('>BI')  # кодек, crc32 словаря (0 — без словаря)
+
+
+@lru_cache(maxsize=None)
+def dictionaries():
+    # {id: байты словаря} и id словаря для записи
+    loaded = {}
+    for path in COMPRESSION_DICTIONARIES:
+        with open(path, 'rb') as file:
+            data = file.read()
+        loaded[zlib.crc32(data)] = data
+    current = zlib.crc32(data) if COMPRESSION_DICTIONARIES else 0
+    return loaded, current
+
+
+def codec():
+    if CODE_COMPRESSION == 'auto':
+        return ZSTD if zstandard is not None else ZLIB
+    return {'none': RAW, 'zlib': ZLIB, 'zstd': ZSTD}[CODE_COMPRESSION]
+
+
+@lru_cache(maxsize=None)
+def zstd_dictionary(dict_id):
+    data = dictionaries()[0][dict_id]
+    return zstandard.ZstdCompressionDict(data, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+
+
+def compress(text):
+    data = text.encode()
+    method = codec() if len(data) >= MIN_COMPRESS_SIZE else RAW
+    loaded, dict_id = dictionaries()
+    if method == ZLIB:
+        compressor = zlib.compressobj(9, zdict=loaded[dict_id]) if dict_id else zlib.compressobj(9)
+        data = compressor.compress(data) + compressor.flush()
+    elif method == ZSTD:
+        options = {'dict_data': zstd_dictionary(dict_id)} if dict_id else {}
+        data = zstandard.ZstdCompressor(level=10, **options).compress(data)
+    else:
+        dict_id = 0
+    return HEADER.pack(method, dict_id) + data
+
+
+def decompress(blob):
+    if isinstance(blob, str):
+        return blob  # строка, записанная до сжатия (текстовое значение в колонке SQLite)
+    blob = bytes(blob)
+    if not blob:
+        return ''
+    method, dict_id = HEADER.unpack_from(blob)
+    data = blob[HEADER.size:]
+    if dict_id and dict_id not in dictionaries()[0]:
+        raise ValueError(f'Compression dictionary {dict_id:#010x} is not configured')
+    if method == ZLIB:
+        decompressor = zlib.decompressobj(zdict=dictionaries()[0][dict_id]) if dict_id else zlib.decompressobj()
+        data = decompressor.decompress(data) + decompressor.flush()
+    elif method == ZSTD:
+        if zstandard is None:
+            raise ValueError('zstandard is required to read zstd-compressed code')
+        options = {'dict_data': zstd_dictionary(dict_id)} if dict_id else {}
+        data = zstandard.ZstdDecompressor(**options).decompress(data)
+    return data.decode()
+
+
+class CompressedTextField(models.BinaryField):
+    # Текст хранится сжатым, в Python виден как обычная строка
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else decompress(value)
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return decompress(value)
+        return value
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if isinstance(value, str):
+            value = compress(value)
+        return super().get_db_prep_value(value, connection, prepared)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
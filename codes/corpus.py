@@ -0,0 +1,220 @@
+import os
+import mmap
+import zlib
+import struct
+import zipfile
+from array import array
+from functools import lru_cache
+from itertools import combinations, product
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from django.conf import settings
+
+from .bulk_upload import BULK_MAX_FILE_SIZE, is_service_file
+from .minhash import ARCHIVE_THRESHOLD, BANDS, ROWS, estimate_similarity, minhash_signature
+from .parallel import CHUNK_SIZE, WORKERS
+from .similarity import IDENTICAL_SIMILARITY, build_artifact, compare_prepared, content_hash
+
+# Сравнение набора файлов (каталог или zip) без загрузки в БД. Память ограничена: в родителе —
+# только имена, хэши и MinHash-подписи файлов, код читается процессами пула через mmap по мере надобности
+CORPUS_ARTIFACT_CACHE = getattr(settings, 'PLAGIARISM_CORPUS_ARTIFACT_CACHE', 2048)  # артефактов на процесс
+PAIR_BUFFER = 100000  # кандидатов сортируется за раз, чтобы пары одного файла шли подряд
+MAX_PENDING_CHUNKS = 4  # пачек в очереди на процесс пула
+MAX_BUCKET = 200
+
+ZIP_LOCAL_HEADER = struct.Struct('<4s22xHH')  # сигнатура, ..., длина имени, длина extra
+
+# Состояние процесса: источник, имена файлов, zip и его отображение в память
+_path = None
+_names = []
+_archive = None
+_archive_data = None
+
+
+def list_entries(path):
+    # Имена файлов корпуса в стабильном порядке: пути относительно каталога или имена в архиве
+    if os.path.isdir(path):
+        names = []
+        for root, dirs, files in os.walk(path):
+            dirs[:] = [name for name in dirs if not name.startswith('.')]
+            relative = os.path.relpath(root, path)
+            for name in files:
+                name = name if relative == '.' else os.path.join(relative, name).replace(os.sep, '/')
+                if not is_service_file(name):
+                    names.append(name)
+        return sorted(names)
+    with zipfile.ZipFile(path) as archive:
+        return [info.filename for info in archive.infolist()
+                if not info.is_dir() and not is_service_file(info.filename)]
+
+
+def init_source(path, names):
+    global _path, _names, _archive, _archive_data
+    _path, _names, _archive, _archive_data = path, names, None, None
+    artifact.cache_clear()
+    if not os.path.isdir(path):
+        # Оглавление zip читается zipfile, данные файлов — из mmap: процессы пула делят страницы в кэше ОС
+        file = open(path, 'rb')
+        _archive = zipfile.ZipFile(file)
+        _archive_data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_zip_member(info):
+    offset = info.header_offset
+    signature, name_size, extra_size = ZIP_LOCAL_HEADER.unpack_from(_archive_data, offset)
+    if signature != b'PK\x03\x04' or info.flag_bits & 0x1 or info.compress_type not in (
+            zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        return _archive.read(info)  # зашифрованные и редкие методы сжатия — через zipfile
+    start = offset + ZIP_LOCAL_HEADER.size + name_size + extra_size
+    data = memoryview(_archive_data)[start:start + info.compress_size]
+    return zlib.decompress(data, -15) if info.compress_type == zipfile.ZIP_DEFLATED else bytes(data)
+
+
+def read_code(index):
+    # Текст файла или None (слишком большой, не UTF-8)
+    name = _names[index]
+    try:
+        if _archive is not None:
+            info = _archive.getinfo(name)
+            return read_zip_member(info).decode('utf-8') if info.file_size <= BULK_MAX_FILE_SIZE else None
+        with open(os.path.join(_path, name), 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0 or size > BULK_MAX_FILE_SIZE:
+                return '' if size == 0 else None
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return str(data, 'utf-8')
+    except UnicodeDecodeError:
+        return None
+
+
+@lru_cache(maxsize=CORPUS_ARTIFACT_CACHE)
+def artifact(index):
+    return build_artifact(read_code(index))
+
+
+def signature_chunk(indices):
+    # (индекс, хэш кода, подпись) для пачки файлов; нечитаемые файлы — с хэшем None
+    rows = []
+    for index in indices:
+        code = read_code(index)
+        if code is None:
+            rows.append((index, None, None))
+        else:
+            rows.append((index, content_hash(code), array('I', minhash_signature(code)).tobytes()))
+    return rows
+
+
+def compare_chunk(pairs):
+    return [(i, j, compare_prepared(artifact(i), artifact(j))) for i, j in pairs]
+
+
+def run_chunks(function, chunks, path, names, workers):
+    # Результаты пачек по мере готовности; в очереди пула не больше MAX_PENDING_CHUNKS пачек на процесс
+    if workers <= 1:
+        init_source(path, names)
+        for chunk in chunks:
+            yield function(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_source, initargs=(path, names)) as executor:
+        pending = set()
+        for chunk in chunks:
+            pending.add(executor.submit(function, chunk))
+            if len(pending) >= workers * MAX_PENDING_CHUNKS:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def chunks_of(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def scan_corpus(path, names, workers=None, progress=None):
+    # Хэши и подписи всех файлов: {индекс: хэш}, [(индекс, подпись)] только для первого файла с таким кодом
+    workers = workers or WORKERS
+    hashes, signatures, seen = {}, [], set()
+    for rows in run_chunks(signature_chunk, chunks_of(range(len(names)), CHUNK_SIZE), path, names, workers):
+        for index, code_hash, signature in rows:
+            if code_hash is None:
+                continue
+            hashes[index] = code_hash
+            if code_hash not in seen:
+                seen.add(code_hash)
+                values = array('I')
+                values.frombytes(signature)
+                signatures.append((index, values))
+        if progress:
+            progress('scan', len(hashes), len(names))
+    return hashes, signatures
+
+
+def band_keys(signature):
+    # Хэш каждой полосы подписи: ключ корзины LSH
+    return array('q', (hash(tuple(signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)))
+
+
+def lsh_candidates(signatures, threshold=ARCHIVE_THRESHOLD, max_bucket=MAX_BUCKET):
+    # Пары уникальных файлов, совпавшие хотя бы в одной полосе LSH и с оценкой не ниже threshold.
+    # Пара выдаётся только в первой общей полосе, поэтому множество пар не хранится.
+    # Корзины больше max_bucket — общий шаблонный код, они пропускаются
+    keys = [band_keys(signature) for _, signature in signatures]
+    oversized = []
+    for band in range(BANDS):
+        buckets = defaultdict(list)
+        for position, key in enumerate(keys):
+            buckets[key[band]].append(position)
+        oversized.append({key for key, members in buckets.items() if len(members) > max_bucket})
+
+        for key, members in buckets.items():
+            if len(members) < 2 or key in oversized[band]:
+                continue
+            for a, b in combinations(members, 2):
+                keys1, keys2 = keys[a], keys[b]
+                if any(keys1[e] == keys2[e] and keys1[e] not in oversized[e] for e in range(band)):
+                    continue  # пара уже выдана в одной из прошлых полос
+                if estimate_similarity(signatures[a][1], signatures[b][1]) >= threshold:
+                    yield signatures[a][0], signatures[b][0]
+
+
+def sorted_batches(pairs, size=PAIR_BUFFER):
+    for batch in chunks_of(pairs, size):
+        yield from sorted(batch)
+
+
+def compare_corpus(path, names=None, threshold=ARCHIVE_THRESHOLD, max_bucket=MAX_BUCKET, workers=None,
+                   progress=None):
+    # Генератор (имя 1, имя 2, метрики) для всех похожих пар корпуса; одинаковые файлы — 100%
+    workers = workers or WORKERS
+    names = names if names is not None else list_entries(path)
+    hashes, signatures = scan_corpus(path, names, workers, progress)
+
+    groups = defaultdict(list)  # хэш кода -> индексы файлов с этим кодом
+    for index, code_hash in sorted(hashes.items()):
+        groups[code_hash].append(index)
+    for members in groups.values():
+        for i, j in combinations(members, 2):
+            yield names[i], names[j], dict(IDENTICAL_SIMILARITY)
+
+    compared = 0
+    candidates = sorted_batches(lsh_candidates(signatures, threshold, max_bucket))
+    for results in run_chunks(compare_chunk, chunks_of(candidates, CHUNK_SIZE), path, names, workers):
+        for i, j, similarity in results:
+            # результат уникальной пары относится ко всем копиям обоих файлов
+            for a, b in product(groups[hashes[i]], groups[hashes[j]]):
+                yield names[min(a, b)], names[max(a, b)], similarity
+        compared += len(results)
+        if progress:
+            progress('compare', compared, None)
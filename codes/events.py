@@ -0,0 +1,112 @@
+import json
+import time
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from .models import ComparisonJob, Student
+from .jobs import job_status
+from .results_query import results_queryset, row_to_dict
+from database_router import replica_reads
+
+# Server-Sent Events о ходе задания сравнения: прогресс и лучшие найденные пары
+EVENTS_POLL_INTERVAL = getattr(settings, 'PLAGIARISM_EVENTS_POLL_INTERVAL', 1.0)
+EVENTS_TOP_MATCHES = getattr(settings, 'PLAGIARISM_EVENTS_TOP_MATCHES', 10)
+EVENTS_KEEPALIVE = 15  # секунд тишины до комментария, который не даёт прокси закрыть соединение
+SNAPSHOT_TTL = 60  # снимки заданий, за которыми никто не следит, удаляются
+FINISHED_STATUSES = ('done', 'failed')
+
+# Снимки заданий процесса: все клиенты, следящие за одним заданием, делят один запрос к БД за интервал
+_snapshots = {}  # id задания -> (время, снимок)
+_locks = {}
+
+
+def top_matches(job, limit=EVENTS_TOP_MATCHES):
+    if job.lesson_id:
+        # матрица урока появляется целиком по завершении задания
+        if not job.result:
+            return []
+        ids = job.result['student_ids']
+        cells = sorted(((value, ids[i], ids[j]) for i, j, value
+                        in zip(job.result['rows'], job.result['cols'], job.result['values']) if i < j),
+                       reverse=True)[:limit]
+        names = dict(Student.objects.filter(id__in={student_id for _, *pair in cells for student_id in pair})
+                     .values_list('id', 'full_name'))
+        return [{'student_1': {'id': id1, 'full_name': names.get(id1)},
+                 'student_2': {'id': id2, 'full_name': names.get(id2)},
+                 'similarity_percentage': value} for value, id1, id2 in cells]
+
+    # пары работ сохраняются пачками, поэтому лучшие из уже посчитанных видны по ходу задания
+    results = results_queryset(job.work_number if not job.work_id else '')
+    if job.work_id:
+        results = results.filter(Q(work_1_id=job.work_id) | Q(work_2_id=job.work_id))
+    return [row_to_dict(row) for row in results[:limit]]
+
+
+def load_snapshot(job_id, previous=None):
+    job = ComparisonJob.objects.filter(id=job_id).first()
+    if job is None:
+        return None
+    status = job_status(job)
+    if previous and (previous['job']['status'], previous['job']['progress']) == (job.status, job.progress):
+        matches = previous['matches']  # новых результатов не было
+    else:
+        with replica_reads():
+            matches = top_matches(job)
+    return {'job': status, 'matches': matches}
+
+
+async def job_snapshot(job_id):
+    lock = _locks.setdefault(job_id, asyncio.Lock())
+    async with lock:
+        now = time.monotonic()
+        cached = _snapshots.get(job_id)
+        if cached and now - cached[0] < EVENTS_POLL_INTERVAL:
+            return cached[1]
+        snapshot = await sync_to_async(load_snapshot)(job_id, cached[1] if cached else None)
+        if snapshot is not None:
+            _snapshots[job_id] = (now, snapshot)
+    prune_snapshots(now)
+    return snapshot
+
+
+def prune_snapshots(now):
+    for job_id in list(_locks):
+        cached = _snapshots.get(job_id)
+        if (cached is None or now - cached[0] > SNAPSHOT_TTL) and not _locks[job_id].locked():
+            _snapshots.pop(job_id, None)
+            del _locks[job_id]
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+async def job_events(job_id):
+    # Поток событий: progress — при изменении состояния, matches — при изменении лучших пар, done — в конце
+    last_job = last_matches = None
+    last_sent = time.monotonic()
+    yield f'retry: {int(EVENTS_POLL_INTERVAL * 3000)}\n\n'
+    while True:
+        snapshot = await job_snapshot(job_id)
+        if snapshot is None:
+            yield format_event('error', {'message': 'Job not found'})
+            return
+        if snapshot['job'] != last_job:
+            last_job = snapshot['job']
+            last_sent = time.monotonic()
+            yield format_event('progress', last_job)
+        if snapshot['matches'] != last_matches:
+            last_matches = snapshot['matches']
+            last_sent = time.monotonic()
+            yield format_event('matches', last_matches)
+        if last_job['status'] in FINISHED_STATUSES:
+            yield format_event('done', last_job)
+            return
+        if time.monotonic() - last_sent > EVENTS_KEEPALIVE:
+            last_sent = time.monotonic()
+            yield ': keepalive\n\n'
+        await asyncio.sleep(EVENTS_POLL_INTERVAL)
@@ -0,0 +1,156 @@
+import hashlib
+from collections import defaultdict
+from itertools import combinations
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Fingerprint
+from .queries import load_codes
+from .tokenizer import tokenize_code, tokens_to_bytes
+
+KGRAM_SIZE = getattr(settings, 'PLAGIARISM_KGRAM_SIZE', 5)
+WINNOW_WINDOW = getattr(settings, 'PLAGIARISM_WINNOW_WINDOW', 4)
+# Кандидат — пара, у которой общих хэшей не меньше этой доли отпечатков меньшей из работ.
+# Порог относительный: абсолютное число общих хэшей набирают почти любые две работы одного задания
+MIN_SHARED_RATIO = getattr(settings, 'PLAGIARISM_MIN_SHARED_RATIO', 0.5)
+# Хэши, которые встречаются у большей доли работ (шаблонный код задания), не дают кандидатов
+COMMON_FINGERPRINT_RATIO = getattr(settings, 'PLAGIARISM_COMMON_FINGERPRINT_RATIO', 0.5)
+COMMON_FINGERPRINT_MIN_COUNT = 10
+
+# Нормализованный поток токенов: array('I') id токенов
+def tokenize(code):
+    return tokenize_code(code)
+
+
+def stable_hash(data):
+    # hash() в Python рандомизирован между процессами, а отпечатки хранятся в БД
+    digest = hashlib.blake2b(data, digest_size=8).digest()
+    return int.from_bytes(digest, 'big') >> 1  # помещается в BigIntegerField
+
+
+def kgram_hashes(tokens, k=KGRAM_SIZE):
+    # Хэш k-граммы — по байтам её id (little-endian), срезы memoryview не копируют данные
+    data = memoryview(tokens_to_bytes(tokens))
+    size = tokens.itemsize
+    if len(tokens) < k:
+        return [stable_hash(data)] if tokens else []
+    return [stable_hash(data[i * size:(i + k) * size]) for i in range(len(tokens) - k + 1)]
+
+
+def winnow(hashes, window=WINNOW_WINDOW):
+    # Из каждого окна берётся минимальный (самый правый) хэш, повторы подряд не записываются
+    if len(hashes) <= window:
+        return [(min(hashes), hashes.index(min(hashes)))] if hashes else []
+
+    selected = []
+    last = -1
+    for start in range(len(hashes) - window + 1):
+        end = start + window
+        pos = min(range(start, end), key=lambda i: (hashes[i], -i))
+        if pos != last:
+            selected.append((hashes[pos], pos))
+            last = pos
+    return selected
+
+
+def fingerprint_code(code):
+    return winnow(kgram_hashes(tokenize(code)))
+
+
+# Индекс отпечатков
+@transaction.atomic
+def index_work(work):
+    Fingerprint.objects.filter(work=work).delete()
+    Fingerprint.objects.bulk_create(
+        Fingerprint(hash=h, position=pos, work=work) for h, pos in fingerprint_code(work.code))
+
+
+@transaction.atomic
+def index_objects(objects, field):
+    # Пакетная индексация работ или отправок: одна вставка на все объекты
+    Fingerprint.objects.filter(**{f'{field}__in': objects}).delete()
+    Fingerprint.objects.bulk_create(
+        (Fingerprint(hash=h, position=pos, **{field: obj}) for obj in objects for h, pos in fingerprint_code(obj.code)),
+        batch_size=1000)
+
+
+def ensure_indexed(objects, field):
+    ids = [obj.id for obj in objects]
+    indexed = set(Fingerprint.objects.filter(**{f'{field}_id__in': ids}).values_list(f'{field}_id', flat=True))
+    missing = [obj for obj in objects if obj.id not in indexed]
+    if missing:
+        # код мог быть не загружен (only/defer) — читаем его одним запросом
+        codes = load_codes(type(missing[0]), [obj.id for obj in missing])
+        for obj in missing:
+            obj.code = codes[obj.id]
+        index_objects(missing, field)
+
+
+def shared_fingerprint_counts(rows, total):
+    # rows: пары (hash, id владельца); результат: {(id1, id2): число общих хэшей} и число хэшей у каждого.
+    # Хэши шаблонного кода не учитываются ни в общих, ни в размерах: иначе они занижают долю у копий
+    owners = defaultdict(set)
+    for h, owner_id in rows:
+        owners[h].add(owner_id)
+
+    common_limit = max(COMMON_FINGERPRINT_RATIO * total, COMMON_FINGERPRINT_MIN_COUNT)
+    counts = defaultdict(int)
+    sizes = defaultdict(int)
+    for ids in owners.values():
+        if len(ids) > common_limit:
+            continue
+        for owner_id in ids:
+            sizes[owner_id] += 1
+        for pair in combinations(sorted(ids), 2):
+            counts[pair] += 1
+    return counts, sizes
+
+
+def shared_ratio(shared, size1, size2):
+    # Доля от меньшей работы: частичное списывание в большую работу тоже находится
+    return shared / min(size1, size2) if size1 and size2 else 0
+
+
+def candidate_pairs(objects, field, min_ratio=MIN_SHARED_RATIO):
+    # {(id1, id2): доля общих отпечатков} — по ней же K лучших пар перебираются в порядке убывания
+    ids = [obj.id for obj in objects]
+    rows = Fingerprint.objects.filter(**{f'{field}_id__in': ids}).values_list('hash', f'{field}_id')
+    counts, sizes = shared_fingerprint_counts(rows, len(ids))
+    ratios = {(a, b): shared_ratio(shared, sizes[a], sizes[b]) for (a, b), shared in counts.items()}
+    return {pair: ratio for pair, ratio in ratios.items() if ratio >= min_ratio}
+
+
+def work_candidate_pairs(works, min_ratio=MIN_SHARED_RATIO):
+    ensure_indexed(works, 'work')
+    return candidate_pairs(works, 'work', min_ratio)
+
+
+def submission_candidate_pairs(submissions, min_ratio=MIN_SHARED_RATIO):
+    ensure_indexed(submissions, 'submission')
+    return candidate_pairs(submissions, 'submission', min_ratio)
+
+
+def work_partners(work, others, min_ratio=MIN_SHARED_RATIO):
+    # Кандидаты в пары для одной работы: O(n) вместо сравнения всех пар набора
+    own = set(Fingerprint.objects.filter(work=work).values_list('hash', flat=True))
+    rows = (Fingerprint.objects.filter(hash__in=own, work__in=others)
+            .exclude(work=work).values_list('hash', 'work_id'))
+    owners = defaultdict(set)
+    for h, owner_id in rows:
+        owners[h].add(owner_id)
+
+    common_limit = max(COMMON_FINGERPRINT_RATIO * (others.count() + 1), COMMON_FINGERPRINT_MIN_COUNT)
+    counts = defaultdict(int)
+    common = defaultdict(int)  # шаблонные хэши партнёров из числа общих с этой работой
+    for ids in owners.values():
+        target = counts if len(ids) + 1 <= common_limit else common
+        for owner_id in ids:
+            target[owner_id] += 1
+    own_size = len(own) - sum(len(ids) + 1 > common_limit for ids in owners.values())
+
+    sizes = dict(Fingerprint.objects.filter(work_id__in=counts).values('work_id')
+                 .annotate(size=Count('hash', distinct=True)).values_list('work_id', 'size'))
+    return {owner_id: shared for owner_id, shared in counts.items()
+            if shared_ratio(shared, own_size, sizes[owner_id] - common[owner_id]) >= min_ratio}
@@ -3,10 +3,22 @@ from .models import Submission, Lesson
 
 
 class SubmissionForm(forms.ModelForm):
+    # Код хранится в CodeBlob, поэтому поле формы объявлено явно
+    code = forms.CharField(widget=forms.Textarea)
+
     class Meta:
         model = Submission
         fields = ['student', 'lesson', 'code']
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.code_blob_id:
+            self.initial.setdefault('code', self.instance.code)
+
+    def save(self, commit=True):
+        self.instance.code = self.cleaned_data['code']
+        return super().save(commit)
+
 
 class LessonSelectForm(forms.Form):
-    lesson = forms.ModelChoiceField(queryset=Lesson.objects.all(), label="Select Lesson", empty_label=None)
\ No newline at end of file
+    lesson = forms.ModelChoiceField(queryset=Lesson.objects.all(), label="Select Lesson", empty_label=None)
@@ -0,0 +1,56 @@
+from .similarity import jaccard_similarity
+
+# NumPy/SciPy необязательны: без них используется поэлементный расчёт
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+
+def incidence_matrix(token_sets):
+    # Строка i — множество токенов работы i в виде разреженного бинарного вектора
+    vocabulary = {}
+    rows, cols = [], []
+    for row, tokens in enumerate(token_sets):
+        for token in tokens:
+            rows.append(row)
+            cols.append(vocabulary.setdefault(token, len(vocabulary)))
+    data = np.ones(len(rows), dtype=np.int32)
+    return sparse.csr_matrix((data, (rows, cols)), shape=(len(token_sets), len(vocabulary)))
+
+
+def to_percent(intersection, union):
+    return np.divide(intersection * 100.0, union, out=np.zeros(np.shape(union)), where=union > 0)
+
+
+def jaccard_matrix(token_sets):
+    # Полная матрица n×n: пересечения — произведение X·Xᵀ, объединения — суммы строк минус пересечение
+    token_sets = list(token_sets)
+    if np is None or sparse is None:
+        return [[jaccard_similarity(set1, set2) for set2 in token_sets] for set1 in token_sets]
+
+    matrix = incidence_matrix(token_sets)
+    intersection = (matrix @ matrix.T).toarray()
+    sizes = np.asarray(matrix.getnnz(axis=1))
+    union = sizes[:, None] + sizes[None, :] - intersection
+    return to_percent(intersection, union)
+
+
+def jaccard_pairs(token_sets, pairs):
+    # token_sets: {id: множество}; сходство только для перечисленных пар, без построения всей матрицы
+    pairs = list(pairs)
+    if np is None or sparse is None or not pairs:
+        return {(id1, id2): jaccard_similarity(token_sets[id1], token_sets[id2]) for id1, id2 in pairs}
+
+    index = {obj_id: i for i, obj_id in enumerate(token_sets)}
+    matrix = incidence_matrix(token_sets.values())
+    left = matrix[[index[id1] for id1, _ in pairs]]
+    right = matrix[[index[id2] for _, id2 in pairs]]
+    intersection = np.asarray(left.multiply(right).sum(axis=1)).ravel()
+    union = np.asarray(left.getnnz(axis=1)) + np.asarray(right.getnnz(axis=1)) - intersection
+    return dict(zip(pairs, to_percent(intersection, union).tolist()))
@@ -0,0 +1,178 @@
+import hashlib
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ComparisonJob, Submission
+from .queries import works_for_results, lesson_submissions
+from .results_cache import compare_lesson, sync_work_results, update_work_results
+from .matrix import SimilarityMatrix
+from .minhash import ensure_minhash
+from .topk import top_k_pairs
+
+ACTIVE_STATUSES = ('pending', 'running', 'done')
+# Задание без отметки воркера дольше этого времени (с) считается брошенным упавшим воркером
+JOB_TIMEOUT = getattr(settings, 'PLAGIARISM_JOB_TIMEOUT', 1800)
+MAX_JOB_ATTEMPTS = getattr(settings, 'PLAGIARISM_MAX_JOB_ATTEMPTS', 3)
+# Как часто работающий воркер отмечается (с), должно быть заметно меньше JOB_TIMEOUT
+HEARTBEAT_INTERVAL = getattr(settings, 'PLAGIARISM_HEARTBEAT_INTERVAL', 60)
+
+
+# Версия данных: если она не изменилась, повторно ставить задание не нужно
+def works_version(works):
+    digest = hashlib.sha256()
+    for work_id, code_hash in sorted((work.id, work.code_hash) for work in works):
+        digest.update(f'{work_id}:{code_hash};'.encode())
+    return digest.hexdigest()
+
+
+def lesson_version(submissions):
+    ids = sorted(sub.id for sub in submissions)
+    latest = max((sub.submission_time for sub in submissions), default=None)
+    return hashlib.sha256(f'{ids};{latest}'.encode()).hexdigest()
+
+
+def find_job(version, **target):
+    target = {'work': None, 'work_number': '', 'lesson_id': None, 'top_k': None, **target}
+    return (ComparisonJob.objects.filter(version=version, status__in=ACTIVE_STATUSES, **target)
+            .order_by('-created_at').first())
+
+
+def target_key(version, work=None, work_number='', lesson_id=None, top_k=None):
+    work_id = work.id if work is not None else ''
+    return hashlib.sha256(f'{version}:{work_id}:{work_number}:{lesson_id or ""}:{top_k or ""}'.encode()).hexdigest()
+
+
+def enqueue(version, **target):
+    # Повторный запрос на те же данные возвращает уже существующее задание. Проверка и вставка не атомарны,
+    # поэтому второе одновременное задание отсекает частичный уникальный индекс по target_key
+    job = find_job(version, **target)
+    if job is not None:
+        return job
+    try:
+        with transaction.atomic():
+            return ComparisonJob.objects.create(version=version, target_key=target_key(version, **target), **target)
+    except IntegrityError:
+        return find_job(version, **target)
+
+
+def enqueue_work(work):
+    return enqueue(work.code_hash, work=work)
+
+
+def enqueue_work_number(work_number='', top_k=None, works=None):
+    # works — уже загруженные работы (id, code_hash), чтобы не читать их повторно
+    version = works_version(works if works is not None else works_for_results(work_number))
+    # Полное сравнение тех же данных уже содержит и K лучших пар
+    full_job = find_job(version, work_number=work_number) if top_k else None
+    return full_job or enqueue(version, work_number=work_number, top_k=top_k)
+
+
+def enqueue_lesson(lesson_id, submissions=None):
+    submissions = submissions if submissions is not None else lesson_submissions(lesson_id)
+    return enqueue(lesson_version(submissions), lesson_id=lesson_id)
+
+
+def latest_lesson_matrix(lesson_id):
+    job = ComparisonJob.objects.filter(lesson_id=lesson_id, status='done').order_by('-finished_at').first()
+    return SimilarityMatrix.from_json(job.result) if job else SimilarityMatrix([])
+
+
+# Выполнение заданий воркером
+def requeue_stale_jobs(timeout=JOB_TIMEOUT, **filters):
+    # Задания упавших воркеров снова ставятся в очередь; после MAX_JOB_ATTEMPTS попыток — failed
+    stale = ComparisonJob.objects.filter(status='running',
+                                         heartbeat_at__lt=timezone.now() - timedelta(seconds=timeout), **filters)
+    stale.filter(attempts__gte=MAX_JOB_ATTEMPTS).update(
+        status='failed', error='Worker stopped responding', finished_at=timezone.now())
+    return stale.update(status='pending', started_at=None, heartbeat_at=None)
+
+
+def claim_next_job(**filters):
+    # Условный UPDATE атомарен и в SQLite, и в PostgreSQL — брокер не нужен.
+    # filters ограничивают очередь (например, заданиями одного номера работы)
+    requeue_stale_jobs(**filters)
+    for job in ComparisonJob.objects.filter(status='pending', **filters).order_by('created_at')[:10]:
+        now = timezone.now()
+        claimed = ComparisonJob.objects.filter(id=job.id, status='pending').update(
+            status='running', started_at=now, heartbeat_at=now, attempts=F('attempts') + 1)
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+@contextmanager
+def heartbeat(job, interval=HEARTBEAT_INTERVAL):
+    # Отметка воркера идёт из отдельного потока, а не только из отчётов о прогрессе:
+    # матрица урока считается одним вызовом бэкенда и отчитывается лишь в конце
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                ComparisonJob.objects.filter(id=job.id, status='running').update(heartbeat_at=timezone.now())
+        finally:
+            connection.close()  # у потока своё соединение с БД
+
+    thread = threading.Thread(target=beat, name=f'heartbeat-{job.id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def report_progress(job):
+    # Отчёт о прогрессе — и отметка воркера: задания без отчётов дольше JOB_TIMEOUT ставятся в очередь заново
+    def progress(done, total):
+        ComparisonJob.objects.filter(id=job.id).update(progress=done, total=total, heartbeat_at=timezone.now())
+    return progress
+
+
+def run_job(job):
+    progress = report_progress(job)
+    try:
+        with heartbeat(job):
+            if job.work_id:
+                update_work_results(job.work, progress)
+            elif job.lesson_id:
+                submissions = (Submission.objects.filter(lesson_id=job.lesson_id).select_related('code_blob')
+                               .only('id', 'student_id', 'code_blob__code'))
+                job.result = compare_lesson(submissions, progress).to_json()
+            else:
+                works = works_for_results(job.work_number)
+                ensure_minhash(works)
+                if job.top_k:
+                    top_k_pairs(works, job.top_k, progress)
+                else:
+                    sync_work_results(works, progress)
+        job.status = 'done'
+    except Exception:
+        job.status = 'failed'
+        job.error = traceback.format_exc()
+
+    job.refresh_from_db(fields=['progress', 'total'])
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'finished_at'])
+    return job
+
+
+def job_status(job):
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'progress': job.progress,
+        'total': job.total,
+        'error': job.error,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
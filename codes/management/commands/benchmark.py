@@ -0,0 +1,143 @@
+import json
+import platform
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from django.test.utils import setup_databases, teardown_databases
+
+from codes import views
+from codes.benchmark import generate_corpus, metric_benchmarks, find_regressions, time_median
+from codes.jobs import claim_next_job, run_job
+from codes.models import CodeBlob, User, Work
+from codes.queries import works_for_results
+from codes.topk import TOP_K
+
+
+def sizes(value):
+    return [int(size) for size in value.split(',') if size]
+
+
+class Command(BaseCommand):
+    help = 'Замеряет метрики схожести и страницы результатов на синтетических работах (JSON-отчёт)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=sizes, default=[10, 100, 1000, 5000],
+                            help='Число работ для замеров метрик, через запятую')
+        parser.add_argument('--view-sizes', type=sizes, default=[10, 100, 1000],
+                            help='Число работ для сквозных замеров (БД, воркер, представления)')
+        parser.add_argument('--full-limit', type=int, default=200,
+                            help='До какого числа работ замерять и полное сравнение всех пар')
+        parser.add_argument('--lines', type=int, default=200, help='Примерный размер работы в строках')
+        parser.add_argument('--languages', default='python,c,java')
+        parser.add_argument('--plagiarism-rate', type=float, default=0.1, help='Доля списанных работ')
+        parser.add_argument('--sample', type=int, default=200, help='Число пар для замера метрик')
+        parser.add_argument('--repeat', type=int, default=3, help='Повторов на замер (берётся медиана)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Файл для JSON-отчёта (по умолчанию stdout)')
+        parser.add_argument('--baseline', help='Прошлый отчёт: упасть, если замеры стали медленнее')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Допустимое замедление (0.2 — 20 %%)')
+
+    def handle(self, *args, **options):
+        languages = tuple(options['languages'].split(','))
+        records = []
+        for n in options['sizes']:
+            corpus = self.corpus(n, languages, options)
+            records.extend(metric_benchmarks([item['code'] for item in corpus], options['sample'],
+                                             options['repeat'], options['seed']))
+            self.stderr.write(f"metrics: n={n} done")
+        if options['view_sizes']:
+            # Сквозные замеры — в отдельной тестовой БД: рабочие данные и очередь не затрагиваются
+            old_config = setup_databases(verbosity=0, interactive=False)
+            try:
+                for n in options['view_sizes']:
+                    records.extend(self.view_benchmarks(self.corpus(n, languages, options), options))
+                    self.stderr.write(f"views: n={n} done")
+            finally:
+                teardown_databases(old_config, verbosity=0)
+
+        report = {
+            'meta': {
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'lines': options['lines'],
+                'languages': languages,
+                'plagiarism_rate': options['plagiarism_rate'],
+                'seed': options['seed'],
+            },
+            'results': records,
+        }
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(text)
+        else:
+            self.stdout.write(text)
+
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)['results']
+            regressions = find_regressions(baseline, records, options['threshold'])
+            for item in regressions:
+                self.stderr.write(f"{item['benchmark']} n={item['n']}: {item['baseline_seconds']:.6f}s -> "
+                                  f"{item['seconds']:.6f}s ({item['slowdown']:.2f}x)")
+            if regressions:
+                raise CommandError(f"{len(regressions)} benchmarks are slower than baseline "
+                                   f"by more than {options['threshold']:.0%}")
+
+    def corpus(self, n, languages, options):
+        return generate_corpus(n, options['lines'], languages, options['plagiarism_rate'], options['seed'])
+
+    def view_benchmarks(self, corpus, options):
+        # Данные создаются в транзакции, которая откатывается: размеры замеряются независимо
+        with transaction.atomic():
+            records = self.run_views(corpus, options)
+            transaction.set_rollback(True)
+        return records
+
+    def run_views(self, corpus, options):
+        n = len(corpus)
+        work_number = f'benchmark-{n}'
+        users = User.objects.bulk_create([User(username=f'benchmark_{n}_{i}', password='default') for i in range(n)])
+        works = [Work(user=user, work_number=work_number, code=item['code']) for user, item in zip(users, corpus)]
+        CodeBlob.store(works)
+        works = Work.objects.bulk_create(works)
+        factory = RequestFactory()
+
+        def request(view, **params):
+            return view(factory.get('/', {'work_number': work_number, **params}))
+
+        def drain_queue():
+            # только задания этого замера
+            while (job := claim_next_job(work_number=work_number)) is not None:
+                run_job(job)
+
+        records = []
+
+        def record(name, seconds, **extra):
+            records.append({'benchmark': name, 'n': n, 'seconds': seconds, **extra})
+
+        # Первый запрос ставит задание K лучших пар, воркер его считает, повторные запросы читают готовое
+        record('view.app_results.first', time_median(lambda: request(views.app_results), 1))
+        record('worker.top_k', time_median(drain_queue, 1))
+        record('view.app_results', time_median(lambda: request(views.app_results), options['repeat']))
+        record('view.results_api', time_median(lambda: request(views.results_api), options['repeat']))
+        record('end_to_end.compare_work_results',
+               time_median(lambda: views.compare_work_results(works_for_results(work_number), TOP_K),
+                           options['repeat']))
+
+        # Качество: доля подброшенных списываний, попавших в K лучших пар
+        planted = {tuple(sorted((works[i].id, works[item['source']].id)))
+                   for i, item in enumerate(corpus) if item['source'] is not None}
+        found = {(result['work_1']['id'], result['work_2']['id'])
+                 for result in views.compare_work_results(works_for_results(work_number), TOP_K)}
+        found = {tuple(sorted(pair)) for pair in found}
+        records.append({'benchmark': 'quality.top_k_recall', 'n': n, 'planted': len(planted),
+                        'value': len(planted & found) / len(planted) if planted else None})
+
+        if n <= options['full_limit']:
+            record('view.app_results_all.first', time_median(lambda: request(views.app_results, all=1), 1))
+            record('worker.all_pairs', time_median(drain_queue, 1))
+            record('view.app_results_all', time_median(lambda: request(views.app_results, all=1),
+                                                       options['repeat']))
+        return records
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from codes.backends import BACKENDS, get_backend
+from codes.benchmark import generate_submissions
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость бэкендов difflib и RapidFuzz на синтетических работах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=50, help='Число работ')
+        parser.add_argument('--lines', type=int, default=200, help='Примерный размер работы в строках')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        texts = dict(enumerate(generate_submissions(options['count'], options['lines'], options['seed'])))
+        pairs = [(i, j) for i in texts for j in texts if i < j]
+
+        timings = {}
+        ratios = {}
+        for name in BACKENDS:
+            try:
+                backend = get_backend(name)
+            except ImportError as e:
+                self.stderr.write(f"{name}: {e}")
+                continue
+            started = time.perf_counter()
+            ratios[name] = backend.ratios(texts, pairs)
+            timings[name] = time.perf_counter() - started
+            self.stdout.write(f"{name}: {len(pairs)} pairs in {timings[name]:.3f}s "
+                              f"({len(pairs) / timings[name]:.0f} pairs/s)")
+
+        if len(timings) == len(BACKENDS):
+            drift = [abs(ratios['difflib'][pair] - ratios['rapidfuzz'][pair]) for pair in pairs]
+            self.stdout.write(f"speedup: {timings['difflib'] / timings['rapidfuzz']:.1f}x, ratio difference: "
+                              f"mean {sum(drift) / len(drift):.2f}, max {max(drift):.2f}")
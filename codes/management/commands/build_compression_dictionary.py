@@ -0,0 +1,29 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Собирает общий словарь сжатия кода из стартового кода курса'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Файлы или каталоги со стартовым кодом')
+        parser.add_argument('--output', required=True, help='Куда записать словарь')
+        parser.add_argument('--size', type=int, default=32 * 1024,
+                            help='Размер словаря в байтах (zlib использует не больше 32 КБ)')
+
+    def handle(self, *args, **options):
+        files = []
+        for path in map(Path, options['paths']):
+            files.extend(sorted(p for p in path.rglob('*') if p.is_file()) if path.is_dir() else [path])
+        if not files:
+            raise CommandError('No starter code files found')
+
+        # Конец словаря ближе к сжимаемым данным, поэтому файлы идут по возрастанию частоты:
+        # повторяющиеся файлы (один и тот же шаблон в разных заданиях) оказываются в конце
+        contents = [file.read_bytes() for file in files]
+        counts = {content: contents.count(content) for content in contents}
+        data = b''.join(sorted(counts, key=counts.get))[-options['size']:]
+        Path(options['output']).write_bytes(data)
+        self.stdout.write(f"Wrote {len(data)} bytes from {len(files)} files to {options['output']}. "
+                          f"Append it to PLAGIARISM_COMPRESSION_DICTIONARIES and run recompress_code.")
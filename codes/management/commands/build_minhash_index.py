@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from codes.minhash import index_minhash
+from codes.models import Work
+
+
+class Command(BaseCommand):
+    help = 'Строит MinHash-подписи и LSH-полосы для работ архива'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Пересчитать и уже проиндексированные работы')
+
+    def handle(self, *args, **options):
+        works = Work.objects.all() if options['all'] else Work.objects.filter(minhash__isnull=True)
+        count = 0
+        for work in works.iterator(chunk_size=500):
+            index_minhash(work)
+            count += 1
+            if count % 1000 == 0:
+                self.stdout.write(f"Indexed {count} works")
+        self.stdout.write(f"Indexed {count} works")
@@ -0,0 +1,112 @@
+import csv
+import sys
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from codes.bulk_upload import bulk_upload, split_entry_name
+from codes.corpus import MAX_BUCKET, chunks_of, compare_corpus, init_source, list_entries, read_code
+from codes.minhash import ARCHIVE_THRESHOLD
+from codes.models import Result
+from codes.results_cache import BATCH_SIZE, fill_result, save_batch
+
+FIELDS = ('file_1', 'file_2', 'jaccard_similarity', 'lcs_similarity', 'tree_similarity', 'similarity_percentage')
+LOAD_BATCH_SIZE = 1000
+
+
+def row_writer(output, format):
+    if format == 'ndjson':
+        return lambda row: output.write(json.dumps(row) + '\n')
+    writer = csv.writer(output)
+    writer.writerow(FIELDS)
+    return lambda row: writer.writerow([row[field] for field in FIELDS])
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает файлы каталога или zip-архива без загрузки в БД (CSV/NDJSON, по желанию — в Result)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Каталог или zip: <work_number>/<user_name>.<ext> или плоский список файлов')
+        parser.add_argument('--format', choices=('csv', 'ndjson'), default='csv')
+        parser.add_argument('--output', help='Файл результатов (по умолчанию stdout)')
+        parser.add_argument('--threshold', type=float, default=ARCHIVE_THRESHOLD,
+                            help='Минимальная оценка MinHash для точного сравнения пары, %%')
+        parser.add_argument('--min-similarity', type=float, default=0,
+                            help='Записывать только пары с similarity_percentage не ниже, %%')
+        parser.add_argument('--max-bucket', type=int, default=MAX_BUCKET,
+                            help='Корзины LSH больше этого размера (общий шаблонный код) пропускаются')
+        parser.add_argument('--workers', type=int, help='Число процессов (по умолчанию PLAGIARISM_WORKERS)')
+        parser.add_argument('--load', action='store_true',
+                            help='Создать работы из файлов и записать результаты в Result')
+        parser.add_argument('--work-number', default='', help='Номер работы для файлов вне подкаталогов (с --load)')
+
+    def handle(self, *args, **options):
+        try:
+            names = list_entries(options['path'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read corpus: {e}")
+        self.stderr.write(f"{len(names)} files")
+
+        works = self.load_works(options['path'], names, options['work_number']) if options['load'] else None
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            written = self.write_results(output, names, works, options)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.stderr.write(f"{written} pairs written")
+
+    def load_works(self, path, names, work_number):
+        # Работы создаются пачками, код в памяти — только для текущей пачки; {имя файла: работа}
+        init_source(path, names)
+        works = {}
+        for indices in chunks_of(range(len(names)), LOAD_BATCH_SIZE):
+            items = []
+            for index in indices:
+                code = read_code(index)
+                user_name, number = split_entry_name(names[index], work_number)
+                if code is not None and number:
+                    items.append({'user_name': user_name, 'work_number': number, 'code': code,
+                                  'file': names[index]})
+            statuses, created = bulk_upload(items)
+            for status, work in zip((status for status in statuses if status['status'] == 'created'), created):
+                works[status['file']] = work
+            self.stderr.write(f"load: {len(works)} works created ({indices[-1] + 1}/{len(names)} files)")
+        return works
+
+    def write_results(self, output, names, works, options):
+        write = row_writer(output, options['format'])
+        written, batch = 0, []
+        for name1, name2, similarity in compare_corpus(options['path'], names, options['threshold'],
+                                                       options['max_bucket'], options['workers'], self.progress()):
+            # similarity_percentage — LCS по токенам, как в Result
+            if similarity['lcs_similarity'] < options['min_similarity']:
+                continue
+            write({'file_1': name1, 'file_2': name2, **similarity,
+                   'similarity_percentage': similarity['lcs_similarity']})
+            written += 1
+
+            if works is not None and name1 in works and name2 in works:
+                work1, work2 = sorted((works[name1], works[name2]), key=lambda work: work.id)
+                batch.append(fill_result(Result(work_1=work1, work_2=work2), similarity, work1, work2))
+                if len(batch) >= BATCH_SIZE:
+                    save_batch(batch)
+                    batch = []
+        save_batch(batch)
+        return written
+
+    def progress(self):
+        # Строка прогресса в stderr не чаще раза в секунду
+        started = last = time.perf_counter()
+
+        def report(stage, done, total):
+            nonlocal last
+            now = time.perf_counter()
+            if now - last < 1 and done != total:
+                return
+            last = now
+            rate = done / (now - started) if now > started else 0
+            of_total = f"/{total}" if total else ''
+            self.stderr.write(f"{stage}: {done}{of_total} ({rate:.0f}/s)")
+        return report
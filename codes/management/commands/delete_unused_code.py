@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from codes.models import CodeBlob
+
+
+class Command(BaseCommand):
+    help = 'Удаляет код (CodeBlob), на который больше не ссылаются работы и отправки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=24,
+                            help='Не удалять блобы моложе этого числа часов (их может ждать загрузка)')
+
+    def handle(self, *args, **options):
+        deleted = CodeBlob.delete_unused(timezone.now() - timedelta(hours=options['min_age']))
+        self.stdout.write(f"Deleted {deleted} unused blobs")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from codes.models import CodeBlob
+
+
+class Command(BaseCommand):
+    help = 'Пересжимает код текущим кодеком и словарём (после смены настроек сжатия)'
+
+    def handle(self, *args, **options):
+        count = 0
+        for blob in CodeBlob.objects.only('hash', 'code').iterator(chunk_size=500):
+            CodeBlob.objects.filter(hash=blob.hash).update(code=blob.code)
+            count += 1
+            if count % 1000 == 0:
+                self.stdout.write(f"Recompressed {count} blobs")
+        self.stdout.write(f"Recompressed {count} blobs")
@@ -0,0 +1,47 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from codes import metrics
+from codes.jobs import claim_next_job, run_job
+
+
+def job_kind(job):
+    if job.lesson_id:
+        return 'lesson'
+    return 'work' if job.work_id else 'work_number'
+
+
+class Command(BaseCommand):
+    help = 'Выполняет задания сравнения из очереди ComparisonJob'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=2.0, help='Пауза между опросами пустой очереди, с')
+        parser.add_argument('--once', action='store_true', help='Обработать очередь и завершиться')
+        parser.add_argument('--metrics-file', help='Файл, куда после каждого задания пишутся метрики воркера')
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+                continue
+
+            kind = job_kind(job)
+            with metrics.timed('comparison_job', kind=kind):
+                job = run_job(job)
+            metrics.inc('comparison_jobs_total', kind=kind, status=job.status)
+            self.stdout.write(f"{job}: {job.progress}/{job.total}")
+            if job.status == 'failed':
+                self.stderr.write(job.error)
+            if options['metrics_file']:
+                self.write_metrics(options['metrics_file'])
+
+    def write_metrics(self, path):
+        # Запись через временный файл: сборщик не увидит файл наполовину записанным
+        with open(f'{path}.tmp', 'w') as file:
+            file.write(metrics.render())
+        os.replace(f'{path}.tmp', path)
@@ -0,0 +1,74 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class SimilarityMatrix:
+    # Симметричная матрица схожести, индексированная id студентов (а не именами — тёзки не затирают друг друга).
+    # При заполненности от DENSE_COVERAGE хранится плотным массивом float32 (NaN — нет значения),
+    # иначе — разреженно, как тройки COO (строка, столбец, значение). Проценты форматируются только в шаблоне.
+    DENSE_COVERAGE = 0.25
+
+    def __init__(self, student_ids, values=None):
+        self.student_ids = list(student_ids)
+        self.index = {student_id: i for i, student_id in enumerate(self.student_ids)}
+        self.dense = None
+        self.sparse = {}
+        if values:
+            self.fill(values)
+
+    def fill(self, values):
+        # values: {(id студента 1, id студента 2): процент}
+        cells = {}
+        for (id1, id2), value in values.items():
+            i, j = self.index[id1], self.index[id2]
+            value = max(value, cells.get((i, j), value))  # несколько отправок одного студента — берём максимум
+            cells[i, j] = cells[j, i] = value
+
+        size = len(self.student_ids)
+        if np is not None and size and len(cells) >= self.DENSE_COVERAGE * size * size:
+            self.dense = np.full((size, size), np.nan, dtype=np.float32)
+            if cells:
+                rows, cols = zip(*cells)
+                self.dense[list(rows), list(cols)] = list(cells.values())
+        else:
+            self.sparse = cells
+
+    @property
+    def is_dense(self):
+        return self.dense is not None
+
+    def get(self, id1, id2):
+        i, j = self.index.get(id1), self.index.get(id2)
+        if i is None or j is None:
+            return None
+        if self.is_dense:
+            value = self.dense[i, j]
+            return None if np.isnan(value) else float(value)
+        return self.sparse.get((i, j))
+
+    def rows(self, students):
+        # Для шаблона: (студент, значения по столбцам students); строки отдаются по одной
+        for student in students:
+            yield student, [self.get(student.id, other.id) for other in students]
+
+    # Сериализация для кэша и хранения в задании
+    def to_json(self):
+        if self.is_dense:
+            rows, cols = np.nonzero(~np.isnan(self.dense))
+            values = self.dense[rows, cols]
+        else:
+            rows, cols, values = (zip(*((i, j, v) for (i, j), v in self.sparse.items()))
+                                  if self.sparse else ((), (), ()))
+        return {
+            'student_ids': self.student_ids,
+            'rows': [int(i) for i in rows],
+            'cols': [int(j) for j in cols],
+            'values': [round(float(v), 4) for v in values],
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        ids = data['student_ids']
+        return cls(ids, {(ids[i], ids[j]): value for i, j, value in zip(data['rows'], data['cols'], data['values'])})
@@ -0,0 +1,120 @@
+import time
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Метрики процесса в текстовом формате Prometheus: счётчики и гистограммы без внешних зависимостей.
+# У каждого процесса (веб, воркер, процессы пула) свой реестр; пул передаёт свои счётчики родителю
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_lock = threading.Lock()
+_counters = defaultdict(float)  # (имя, метки) -> значение
+_histograms = {}  # (имя, метки) -> [счётчики корзин, сумма, количество]
+_help = {}
+
+
+def labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def describe(name, text):
+    _help[name] = text
+
+
+def inc(name, value=1, **labels):
+    with _lock:
+        _counters[name, labels_key(labels)] += value
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    key = name, labels_key(labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0, buckets]
+        histogram[0][bisect_left(buckets, value)] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+@contextmanager
+def timed(name, **labels):
+    # Время блока копится в счётчиках <name>_seconds_total и <name>_calls_total
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            key = labels_key(labels)
+            _counters[f'{name}_seconds_total', key] += elapsed
+            _counters[f'{name}_calls_total', key] += 1
+
+
+def drain():
+    # Счётчики процесса пула для передачи родителю; после передачи они обнуляются
+    with _lock:
+        counters = dict(_counters)
+        _counters.clear()
+    return counters
+
+
+def merge(counters):
+    with _lock:
+        for key, value in counters.items():
+            _counters[key] += value
+
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render():
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, (list(h[0]), h[1], h[2], h[3])) for key, h in _histograms.items())
+
+    lines = []
+    seen = set()
+    for (name, key), value in counters:
+        if name not in seen:
+            seen.add(name)
+            if name in _help:
+                lines.append(f'# HELP {name} {_help[name]}')
+            lines.append(f'# TYPE {name} counter')
+        lines.append(f'{name}{format_labels(key)} {value:g}')
+    for (name, key), (bucket_counts, total, count, buckets) in histograms:
+        if name not in seen:
+            seen.add(name)
+            if name in _help:
+                lines.append(f'# HELP {name} {_help[name]}')
+            lines.append(f'# TYPE {name} histogram')
+        cumulative = 0
+        for bound, bucket_count in zip((*buckets, '+Inf'), bucket_counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{format_labels(key, [("le", bound)])} {cumulative}')
+        lines.append(f'{name}_sum{format_labels(key)} {total:g}')
+        lines.append(f'{name}_count{format_labels(key)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def render_to_response(request, template_name, context=None, **kwargs):
+    # django.shortcuts.render со временем рендеринга шаблона
+    from django.shortcuts import render
+    with timed('template_render', template=template_name):
+        return render(request, template_name, context, **kwargs)
+
+
+describe('http_request_duration_seconds', 'Request latency by view')
+describe('http_request_sql_seconds', 'Time spent in SQL per request by view')
+describe('similarity_metric_seconds_total', 'Time spent in each similarity metric')
+describe('pairs_compared_total', 'Pairs compared by a metric (cache misses)')
+describe('result_cache_hits_total', 'Pairs served from the Result cache')
+describe('artifact_cache_hits_total', 'Preprocessed artifacts served from CodeArtifact')
+describe('code_bytes_processed_total', 'Source bytes tokenized and parsed')
+describe('artifact_cache_misses_total', 'Artifacts built because CodeArtifact had no row')
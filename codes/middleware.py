@@ -0,0 +1,93 @@
+import os
+import time
+import random
+import cProfile
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+# Каталог для .prof-файлов cProfile; None — профилирование выключено
+PROFILE_DIR = getattr(settings, 'PLAGIARISM_PROFILE_DIR', None)
+# Доля запросов, профилируемых без ?profile=1 (0 — только по явному запросу)
+PROFILE_SAMPLE_RATE = getattr(settings, 'PLAGIARISM_PROFILE_SAMPLE_RATE', 0)
+
+
+class SqlTimer:
+    # execute_wrapper: суммарное время и число SQL-запросов за время запроса
+    def __init__(self):
+        self.seconds = 0.0
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+def should_profile(request):
+    if PROFILE_DIR is None:
+        return False
+    return request.GET.get('profile') == '1' or random.random() < PROFILE_SAMPLE_RATE
+
+
+def dump_profile(profile, request):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = request.path.strip('/').replace('/', '_') or 'index'
+    profile.dump_stats(os.path.join(PROFILE_DIR, f'{name}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}.prof'))
+
+
+class MetricsMiddleware:
+    # Гистограммы задержки и времени SQL по представлениям, по запросу — профиль cProfile
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        timer = SqlTimer()
+        profile = cProfile.Profile() if should_profile(request) else None
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            if profile:
+                profile.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profile:
+                    profile.disable()
+        self.record(request, response, time.perf_counter() - started, timer)
+        if profile:
+            dump_profile(profile, request)
+        return response
+
+    async def __acall__(self, request):
+        # Под ASGI запросы к БД идут в потоках sync_to_async, поэтому время SQL не выделяется и профиль не снимается
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, elapsed, timer=None):
+        # Для потоковых ответов это время до первого байта
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        metrics.observe('http_request_duration_seconds', elapsed, view=view, method=request.method,
+                        status=response.status_code)
+        if timer is not None:
+            metrics.observe('http_request_sql_seconds', timer.seconds, view=view)
+            metrics.inc('http_requests_sql_queries_total', timer.queries, view=view)
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codes', '0005_alter_student_full_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Fingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.BigIntegerField()),
+                ('position', models.PositiveIntegerField()),
+                ('submission', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='fingerprints', to='codes.submission')),
+                ('work', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='fingerprints', to='codes.work')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hash', 'work'], name='codes_finge_hash_e83b6a_idx'), models.Index(fields=['hash', 'submission'], name='codes_finge_hash_3d72f8_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.5 on 2026-10-18 11:30
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_code_hash(apps, schema_editor):
+    Work = apps.get_model('codes', 'Work')
+    for work in Work.objects.only('id', 'code').iterator():
+        Work.objects.filter(id=work.id).update(code_hash=hashlib.sha256(work.code.encode()).hexdigest())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codes', '0006_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='result',
+            name='jaccard_similarity',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='lcs_similarity',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='tree_similarity',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='work_1_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='work_2_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='work',
+            name='code_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.RunPython(fill_code_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codes', '0008_comparisonjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeArtifact',
+            fields=[
+                ('code_hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('normalized', models.TextField()),
+                ('tokens', models.JSONField()),
+                ('ast_signature', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def reset_structure_cache(apps, schema_editor):
+    # Сигнатуры AST теперь — мультимножества хэшей поддеревьев, а tree_similarity — процент:
+    # старые артефакты удаляются, старые результаты помечаются устаревшими и будут пересчитаны
+    apps.get_model('codes', 'CodeArtifact').objects.all().delete()
+    apps.get_model('codes', 'Result').objects.update(work_1_hash='', work_2_hash='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codes', '0010_minhash_lsh'),
+    ]
+
+    operations = [
+        migrations.RunPython(reset_structure_cache, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 11:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codes', '0011_subtree_signatures'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comparisonjob',
+            name='top_k',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+def drop_old_lesson_results(apps, schema_editor):
+    # Результат задания урока теперь — сериализованная SimilarityMatrix; старые задания пересчитываются заново
+    apps.get_model('codes', 'ComparisonJob').objects.filter(lesson__isnull=False).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codes', '0012_comparisonjob_top_k'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_old_lesson_results, migrations.RunPython.noop),
+    ]
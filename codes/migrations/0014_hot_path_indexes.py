@@ -0,0 +1,45 @@
+# Generated by Django 5.1.5 on 2026-10-18 11:43
+
+from django.db import migrations, models
+from django.db.models import Count, F, Max
+
+
+def drop_unordered_results(apps, schema_editor):
+    # Результаты — кэш: строки в обратном порядке и дубликаты пар удаляются и при необходимости пересчитываются
+    Result = apps.get_model('codes', 'Result')
+    Result.objects.filter(work_1__gte=F('work_2')).delete()
+    duplicates = (Result.objects.values('work_1', 'work_2').annotate(keep=Max('id'), count=Count('id'))
+                  .filter(count__gt=1).values_list('work_1', 'work_2', 'keep'))
+    for work_1, work_2, keep in duplicates:
+        Result.objects.filter(work_1=work_1, work_2=work_2).exclude(id=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codes', '0013_lesson_job_matrix'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_unordered_results, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['full_name'], name='student_full_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['lesson', 'student'], name='submission_lesson_student_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='work',
+            index=models.Index(fields=['work_number', 'upload_date'], name='work_number_upload_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='result',
+            constraint=models.UniqueConstraint(fields=('work_1', 'work_2'), name='result_pair_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='result',
+            constraint=models.CheckConstraint(condition=models.Q(('work_1__lt', models.F('work_2'))), name='result_pair_ordered'),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:05
+
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_code_to_blobs(apps, schema_editor):
+    CodeBlob = apps.get_model('codes', 'CodeBlob')
+    for model_name in ('Work', 'Submission'):
+        model = apps.get_model('codes', model_name)
+        for obj in model.objects.only('id', 'code').iterator():
+            code_hash = hashlib.sha256(obj.code.encode()).hexdigest()
+            CodeBlob.objects.get_or_create(hash=code_hash, defaults={'code': obj.code, 'size': len(obj.code)})
+            model.objects.filter(id=obj.id).update(code_blob_id=code_hash)
+
+
+def restore_code(apps, schema_editor):
+    for model_name in ('Work', 'Submission'):
+        model = apps.get_model('codes', model_name)
+        for obj in model.objects.select_related('code_blob').iterator():
+            model.objects.filter(id=obj.id).update(code=obj.code_blob.code)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codes', '0014_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeBlob',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('code', models.TextField()),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RemoveField(
+            model_name='work',
+            name='code_hash',
+        ),
+        migrations.AddField(
+            model_name='work',
+            name='code_blob',
+            field=models.ForeignKey(db_column='code_hash', null=True, on_delete=django.db.models.deletion.PROTECT,
+                                    related_name='+', to='codes.codeblob'),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='code_blob',
+            field=models.ForeignKey(db_column='code_hash', null=True, on_delete=django.db.models.deletion.PROTECT,
+                                    related_name='+', to='codes.codeblob'),
+        ),
+        migrations.AlterField(
+            model_name='work',
+            name='code',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='submission',
+            name='code',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(move_code_to_blobs, restore_code),
+        migrations.RemoveField(
+            model_name='work',
+            name='code',
+        ),
+        migrations.RemoveField(
+            model_name='submission',
+            name='code',
+        ),
+        migrations.AlterField(
+            model_name='work',
+            name='code_blob',
+            field=models.ForeignKey(db_column='code_hash', on_delete=django.db.models.deletion.PROTECT,
+                                    related_name='+', to='codes.codeblob'),
+        ),
+        migrations.AlterField(
+            model_name='submission',
+            name='code_blob',
+            field=models.ForeignKey(db_column='code_hash', on_delete=django.db.models.deletion.PROTECT,
+                                    related_name='+', to='codes.codeblob'),
+        ),
+    ]
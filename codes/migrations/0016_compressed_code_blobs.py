@@ -0,0 +1,51 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:30
+
+import codes.compression
+from django.db import migrations, models
+
+
+def compress_blobs(apps, schema_editor):
+    CodeBlob = apps.get_model('codes', 'CodeBlob')
+    for blob in CodeBlob.objects.only('hash', 'code').iterator(chunk_size=500):
+        CodeBlob.objects.filter(hash=blob.hash).update(compressed=blob.code)
+
+
+def decompress_blobs(apps, schema_editor):
+    CodeBlob = apps.get_model('codes', 'CodeBlob')
+    for blob in CodeBlob.objects.only('hash', 'compressed').iterator(chunk_size=500):
+        CodeBlob.objects.filter(hash=blob.hash).update(code=blob.compressed)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codes', '0015_code_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codeblob',
+            name='compressed',
+            field=codes.compression.CompressedTextField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='codeblob',
+            name='code',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(compress_blobs, decompress_blobs),
+        migrations.RemoveField(
+            model_name='codeblob',
+            name='code',
+        ),
+        migrations.RenameField(
+            model_name='codeblob',
+            old_name='compressed',
+            new_name='code',
+        ),
+        migrations.AlterField(
+            model_name='codeblob',
+            name='code',
+            field=codes.compression.CompressedTextField(),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+
+def reset_token_indexes(apps, schema_editor):
+    # Токены теперь — id с классами-заменителями для имён и литералов: артефакты, отпечатки и MinHash
+    # строятся заново, старые результаты помечаются устаревшими и будут пересчитаны
+    for model_name in ('CodeArtifact', 'Fingerprint', 'LSHBucket', 'MinHashSignature'):
+        apps.get_model('codes', model_name).objects.all().delete()
+    apps.get_model('codes', 'Result').objects.update(work_1_hash='', work_2_hash='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codes', '0016_compressed_code_blobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(reset_token_indexes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='codeartifact',
+            name='normalized',
+        ),
+        migrations.RemoveField(
+            model_name='codeartifact',
+            name='tokens',
+        ),
+        migrations.AddField(
+            model_name='codeartifact',
+            name='tokens',
+            field=models.BinaryField(default=b''),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def copy_creation_time(apps, schema_editor):
+    apps.get_model('codes', 'Work').objects.update(updated_at=F('upload_date'))
+    apps.get_model('codes', 'Submission').objects.update(updated_at=F('submission_time'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codes', '0017_token_arrays'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='work',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_creation_time, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def reset_token_indexes(apps, schema_editor):
+    # Литералы теперь остаются в потоке токенов: артефакты, отпечатки и MinHash строятся заново,
+    # старые результаты помечаются устаревшими. Готовые задания отбирали пары по старым отпечаткам,
+    # поэтому удаляются и будут поставлены в очередь снова
+    for model_name in ('CodeArtifact', 'Fingerprint', 'LSHBucket', 'MinHashSignature'):
+        apps.get_model('codes', model_name).objects.all().delete()
+    apps.get_model('codes', 'Result').objects.update(work_1_hash='', work_2_hash='')
+    apps.get_model('codes', 'ComparisonJob').objects.filter(status='done').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codes', '0018_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(reset_token_indexes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:35
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_job_keys(apps, schema_editor):
+    # Ключи цели для существующих заданий (как jobs.target_key); из дубликатов активных заданий
+    # остаётся самое раннее, остальные помечаются failed — иначе уникальный индекс не создать
+    ComparisonJob = apps.get_model('codes', 'ComparisonJob')
+    active = set()
+    for job in ComparisonJob.objects.order_by('created_at', 'id'):
+        key = (f'{job.version}:{job.work_id or ""}:{job.work_number}:{job.lesson_id or ""}:'
+               f'{job.top_k or ""}')
+        job.target_key = hashlib.sha256(key.encode()).hexdigest()
+        job.heartbeat_at = job.started_at
+        if job.status in ('pending', 'running'):
+            if job.target_key in active:
+                job.status = 'failed'
+                job.error = 'Duplicate job'
+            active.add(job.target_key)
+        job.save(update_fields=['target_key', 'heartbeat_at', 'status', 'error'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('codes', '0019_literal_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comparisonjob',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comparisonjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='comparisonjob',
+            name='target_key',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.RunPython(fill_job_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='comparisonjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ('pending', 'running'))), fields=('target_key',), name='comparisonjob_active_target_unique'),
+        ),
+    ]
@@ -0,0 +1,127 @@
+import random
+import hashlib
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import LSHBucket, MinHashSignature, Work
+from .fingerprints import kgram_hashes, tokenize
+from .queries import load_codes
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+NUM_PERMUTATIONS = 128
+BANDS = 32  # 32 полосы по 4 строки: порог срабатывания LSH около 42% сходства
+ROWS = NUM_PERMUTATIONS // BANDS
+ARCHIVE_THRESHOLD = getattr(settings, 'PLAGIARISM_ARCHIVE_THRESHOLD', 50)
+ARCHIVE_LIMIT = getattr(settings, 'PLAGIARISM_ARCHIVE_LIMIT', 20)
+# Корзины больше этого — общий шаблонный код (стартовый код задания), как MAX_BUCKET в codes.corpus
+ARCHIVE_MAX_BUCKET = getattr(settings, 'PLAGIARISM_ARCHIVE_MAX_BUCKET', 200)
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+UINT64 = (1 << 64) - 1
+
+# Фиксированное зерно: подписи, сохранённые в БД, должны совпадать между процессами
+_rng = random.Random(20250124)
+PERMUTATIONS = [(_rng.randint(1, MERSENNE_PRIME - 1), _rng.randint(0, MERSENNE_PRIME - 1))
+                for _ in range(NUM_PERMUTATIONS)]
+
+
+# Подписи
+def minhash_signature(code):
+    # h(x) = ((a·x + b) mod p) & 0xFFFFFFFF с переполнением uint64, как в векторной версии
+    shingles = {h & MAX_HASH for h in kgram_hashes(tokenize(code))}
+    if not shingles:
+        return [MAX_HASH] * NUM_PERMUTATIONS
+
+    if np is not None:
+        values = np.fromiter(shingles, dtype=np.uint64)
+        a = np.array([a for a, _ in PERMUTATIONS], dtype=np.uint64)
+        b = np.array([b for _, b in PERMUTATIONS], dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            hashed = ((values[:, None] * a + b) % np.uint64(MERSENNE_PRIME)) & np.uint64(MAX_HASH)
+        return hashed.min(axis=0).tolist()
+
+    return [min((((x * a) & UINT64) + b & UINT64) % MERSENNE_PRIME & MAX_HASH for x in shingles)
+            for a, b in PERMUTATIONS]
+
+
+def band_buckets(signature):
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(repr(rows).encode(), digest_size=8).digest()
+        yield band, int.from_bytes(digest, 'big') >> 1
+
+
+def estimate_similarity(signature1, signature2):
+    return sum(x == y for x, y in zip(signature1, signature2)) / NUM_PERMUTATIONS * 100
+
+
+# Индекс архива
+@transaction.atomic
+def index_minhash(work):
+    signature = minhash_signature(work.code)
+    MinHashSignature.objects.update_or_create(work=work, defaults={'signature': signature})
+    LSHBucket.objects.filter(work=work).delete()
+    LSHBucket.objects.bulk_create(LSHBucket(work=work, band=band, bucket=bucket)
+                                  for band, bucket in band_buckets(signature))
+    return signature
+
+
+@transaction.atomic
+def index_minhash_bulk(works):
+    signatures = {work.id: minhash_signature(work.code) for work in works}
+    MinHashSignature.objects.filter(work__in=works).delete()
+    LSHBucket.objects.filter(work__in=works).delete()
+    MinHashSignature.objects.bulk_create(
+        (MinHashSignature(work=work, signature=signatures[work.id]) for work in works), batch_size=1000)
+    LSHBucket.objects.bulk_create(
+        (LSHBucket(work=work, band=band, bucket=bucket)
+         for work in works for band, bucket in band_buckets(signatures[work.id])), batch_size=1000)
+    return signatures
+
+
+def ensure_minhash(works):
+    # Подписи для работ, загруженных без индексации (массовая загрузка)
+    ids = [work.id for work in works]
+    indexed = set(MinHashSignature.objects.filter(work_id__in=ids).values_list('work_id', flat=True))
+    missing = [work.id for work in works if work.id not in indexed]
+    if missing:
+        codes = load_codes(Work, missing)
+        index_minhash_bulk([Work(id=work_id, code=codes[work_id]) for work_id in missing])
+
+
+def bucket_filter(keys):
+    return reduce(or_, (Q(band=band, bucket=bucket) for band, bucket in keys))
+
+
+def archive_check(work, threshold=ARCHIVE_THRESHOLD, limit=ARCHIVE_LIMIT, max_bucket=ARCHIVE_MAX_BUCKET):
+    # Время не зависит от размера архива: BANDS индексных поисков и оценка по подписям кандидатов.
+    # Переполненные корзины пропускаются — иначе в память читались бы подписи всех работ с тем же шаблоном
+    stored = MinHashSignature.objects.filter(work=work).first()
+    signature = stored.signature if stored else index_minhash(work)
+
+    sizes = (LSHBucket.objects.filter(bucket_filter(band_buckets(signature))).values('band', 'bucket')
+             .annotate(size=Count('id')).values_list('band', 'bucket', 'size'))
+    keys = [(band, bucket) for band, bucket, size in sizes if size <= max_bucket + 1]  # +1 — сама работа
+    if not keys:
+        return []
+    candidates = LSHBucket.objects.filter(bucket_filter(keys)).exclude(work=work).values_list('work_id', flat=True)
+    signatures = MinHashSignature.objects.filter(work_id__in=set(candidates)).values_list('work_id', 'signature')
+
+    scored = [(estimate_similarity(signature, other), work_id) for work_id, other in signatures]
+    scored = sorted((item for item in scored if item[0] >= threshold), reverse=True)[:limit]
+    works = Work.objects.select_related('user').in_bulk([work_id for _, work_id in scored])
+    return [{
+        'work_id': work_id,
+        'work_number': works[work_id].work_number,
+        'user': works[work_id].user.username,
+        'estimated_similarity': round(similarity, 2),
+    } for similarity, work_id in scored]
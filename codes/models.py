@@ -1,5 +1,9 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+
+from .similarity import content_hash
+from .compression import CompressedTextField
+from .backends import get_backend
 
 
 class User(AbstractUser):
@@ -26,6 +30,69 @@ class User(AbstractUser):
     )
 
 
+class CodeBlob(models.Model):
+    # Хранилище кода с адресацией по содержимому: одинаковый код хранится один раз
+    hash = models.CharField(max_length=64, primary_key=True)  # SHA-256 кода
+    code = CompressedTextField()  # хранится сжатым (codes.compression)
+    size = models.PositiveIntegerField(default=0)  # длина несжатого кода
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Blob {self.hash[:12]}"
+
+    @classmethod
+    def for_code(cls, code):
+        return cls(hash=content_hash(code), code=code, size=len(code))
+
+    @classmethod
+    def store(cls, objects):
+        # Сохраняет ещё не записанные блобы объектов одной вставкой; существующие хэши пропускаются
+        blobs = {obj.code_blob.hash: obj.code_blob for obj in objects
+                 if obj.code_blob_id and obj.code_blob._state.adding}
+        cls.objects.bulk_create(blobs.values(), ignore_conflicts=True)
+        for blob in blobs.values():
+            blob._state.adding = False
+
+    @classmethod
+    def delete_unused(cls, created_before, batch_size=500):
+        # Блобы, на которые больше не ссылаются работы и отправки (код заменён или удалён), и их артефакты.
+        # Свежие блобы не трогаются: блоб записывается раньше строки, которая на него ссылается
+        unused = (cls.objects.filter(created_at__lt=created_before)
+                  .exclude(hash__in=Work.objects.values('code_blob'))
+                  .exclude(hash__in=Submission.objects.values('code_blob')))
+        deleted = 0
+        while hashes := list(unused.values_list('hash', flat=True)[:batch_size]):
+            with transaction.atomic():
+                CodeArtifact.objects.filter(code_hash__in=hashes).delete()
+                deleted += unused.filter(hash__in=hashes).delete()[0]
+        return deleted
+
+
+class BlobCodeModel(models.Model):
+    # Код работы или отправки хранится в CodeBlob; code — прозрачный доступ к нему
+    code_blob = models.ForeignKey(CodeBlob, on_delete=models.PROTECT, related_name='+', db_column='code_hash')
+    updated_at = models.DateTimeField(auto_now=True)  # входит в версию страниц результатов (codes.page_cache)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def code_hash(self):
+        return self.code_blob_id
+
+    @property
+    def code(self):
+        return self.code_blob.code
+
+    @code.setter
+    def code(self, value):
+        self.code_blob = CodeBlob.for_code(value)
+
+    def save(self, *args, **kwargs):
+        CodeBlob.store([self])
+        super().save(*args, **kwargs)
+
+
 class Lesson(models.Model):
     title = models.CharField(max_length=100)
 
@@ -37,49 +104,175 @@ class Student(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)  # Связываем с User, добавлен null и blank для совместимости
     full_name = models.CharField(max_length=200)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['full_name'], name='student_full_name_idx'),
+        ]
+
     def __str__(self):
         return self.full_name
 
 
-class Submission(models.Model):
+class Submission(BlobCodeModel):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE)
-    code = models.TextField()
     submission_time = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['lesson', 'student'], name='submission_lesson_student_idx'),
+        ]
+
     def __str__(self):
         return f"Submission by {self.student.full_name} for lesson {self.lesson.title}"
 
 
-class Work(models.Model):
+class Work(BlobCodeModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="works")
     work_number = models.CharField(max_length=50)
-    code = models.TextField()
     upload_date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['work_number', 'upload_date'], name='work_number_upload_idx'),
+        ]
+
     def __str__(self):
         return f"Work {self.work_number} by {self.user.username}"
 
 
-from difflib import SequenceMatcher
-
 class Result(models.Model):
+    # Кэш попарного сравнения: work_1_id < work_2_id, хэши кода фиксируют, с какими версиями работ он посчитан
     work_1 = models.ForeignKey(Work, related_name='work_1', on_delete=models.CASCADE)
     work_2 = models.ForeignKey(Work, related_name='work_2', on_delete=models.CASCADE)
+    work_1_hash = models.CharField(max_length=64, blank=True)
+    work_2_hash = models.CharField(max_length=64, blank=True)
+    jaccard_similarity = models.FloatField(default=0)
+    lcs_similarity = models.FloatField(default=0)
+    tree_similarity = models.FloatField(default=0)
     similarity_percentage = models.FloatField()
     report = models.TextField()
 
+    class Meta:
+        constraints = [
+            # Одна строка на пару, в порядке work_1_id < work_2_id
+            models.UniqueConstraint(fields=['work_1', 'work_2'], name='result_pair_unique'),
+            models.CheckConstraint(condition=models.Q(work_1__lt=models.F('work_2')), name='result_pair_ordered'),
+        ]
+
     def __str__(self):
         return f"Result between Work {self.work_1.work_number} and Work {self.work_2.work_number}"
 
+    @property
+    def similarity(self):
+        return {
+            'jaccard_similarity': self.jaccard_similarity,
+            'lcs_similarity': self.lcs_similarity,
+            'tree_similarity': self.tree_similarity,
+        }
+
     def save(self, *args, **kwargs):
-        similarity = self.calculate_similarity(self.work_1.code, self.work_2.code)
-        self.similarity_percentage = similarity
-        self.report = f"Similarity: {similarity}%"
+        if self.similarity_percentage is None:
+            self.similarity_percentage = self.calculate_similarity(self.work_1.code, self.work_2.code)
+        self.report = f"Similarity: {self.similarity_percentage}%"
         super().save(*args, **kwargs)
 
-def calculate_similarity(self, code1, code2):
-        return SequenceMatcher(None, code1, code2).ratio() * 100
+    def calculate_similarity(self, code1, code2):
+        return get_backend().ratio(code1, code2)
+
+
+class Fingerprint(models.Model):
+    # Отпечаток (winnowing) работы или отправки: хэш k-граммы токенов и её позиция
+    hash = models.BigIntegerField()
+    position = models.PositiveIntegerField()
+    work = models.ForeignKey(Work, on_delete=models.CASCADE, null=True, blank=True, related_name='fingerprints')
+    submission = models.ForeignKey(Submission, on_delete=models.CASCADE, null=True, blank=True,
+                                   related_name='fingerprints')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['hash', 'work']),
+            models.Index(fields=['hash', 'submission']),
+        ]
+
+    def __str__(self):
+        return f"Fingerprint {self.hash} at {self.position}"
+
+
+class MinHashSignature(models.Model):
+    # MinHash-подпись работы для приближённого поиска по архиву
+    work = models.OneToOneField(Work, on_delete=models.CASCADE, primary_key=True, related_name='minhash')
+    signature = models.JSONField()
+
+    def __str__(self):
+        return f"MinHash of Work {self.work_id}"
+
+
+class LSHBucket(models.Model):
+    # Полоса (band) LSH: работы с одинаковым bucket в одной полосе — кандидаты в почти-дубликаты
+    work = models.ForeignKey(Work, on_delete=models.CASCADE, related_name='lsh_buckets')
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['band', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"Band {self.band} bucket {self.bucket} of Work {self.work_id}"
+
+
+class CodeArtifact(models.Model):
+    # Предобработанный код (id токенов, сигнатура AST), общий для одинакового кода
+    code_hash = models.CharField(max_length=64, primary_key=True)
+    tokens = models.BinaryField()  # array('I') id токенов, little-endian (codes.tokenizer)
+    ast_signature = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Artifact {self.code_hash[:12]}"
+
+
+class ComparisonJob(models.Model):
+    # Задание очереди сравнения: одна работа, все работы с номером work_number (или K лучших пар) или урок
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    work = models.ForeignKey(Work, on_delete=models.CASCADE, null=True, blank=True)
+    work_number = models.CharField(max_length=50, blank=True)
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, null=True, blank=True)
+    version = models.CharField(max_length=64, blank=True)  # хэш состояния данных, для которого поставлено задание
+    top_k = models.PositiveIntegerField(null=True, blank=True)  # только K самых похожих пар вместо всех
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Отметка живого воркера: обновляется при захвате задания и при каждом отчёте о прогрессе
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    # Хэш версии и цели задания: не больше одного ожидающего или выполняемого задания на одни и те же данные
+    target_key = models.CharField(max_length=64, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['target_key'], condition=models.Q(status__in=('pending', 'running')),
+                                    name='comparisonjob_active_target_unique'),
+        ]
+
+    def __str__(self):
+        return f"Comparison job {self.id} ({self.status})"
+
 
 class PostgresModel(models.Model):
     title = models.CharField(max_length=255)
@@ -99,3 +292,4 @@ class SqliteModel(models.Model):
 
     def __str__(self):
         return self.name
+
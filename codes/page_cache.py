@@ -0,0 +1,91 @@
+import hashlib
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Q, Sum
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.utils.safestring import mark_safe
+
+from . import metrics
+from .models import ComparisonJob, Submission, Work
+
+# Фрагменты хранятся под ключом с версией данных: после загрузки или изменения работы версия меняется,
+# и старые фрагменты просто перестают читаться (и вытесняются по времени жизни)
+FRAGMENT_TIMEOUT = getattr(settings, 'PLAGIARISM_FRAGMENT_CACHE_TIMEOUT', 3600)
+
+
+# Состояние данных страницы: число строк и последние отметки времени
+def work_number_stats(work_number):
+    works = Work.objects.filter(work_number=work_number) if work_number else Work.objects.all()
+    return works.aggregate(works=Count('id'), updated=Max('updated_at'))
+
+
+def lesson_stats(lesson_id):
+    return Submission.objects.filter(lesson_id=lesson_id).aggregate(submissions=Count('id'),
+                                                                    updated=Max('updated_at'))
+
+
+def work_number_jobs(work_number):
+    # Результаты страницы меняют и задания по номеру работы, и задания отдельных работ
+    if not work_number:
+        return ComparisonJob.objects.filter(lesson=None)
+    return ComparisonJob.objects.filter(Q(work_number=work_number, lesson=None) | Q(work__work_number=work_number))
+
+
+def lesson_jobs(lesson_id):
+    return ComparisonJob.objects.filter(lesson_id=lesson_id)
+
+
+def job_stats(jobs):
+    # Прогресс растёт по мере сохранения пачек результатов, поэтому тоже входит в версию
+    return jobs.aggregate(jobs=Count('id'), created=Max('created_at'), started=Max('started_at'),
+                          finished=Max('finished_at'), progress=Sum('progress'))
+
+
+def with_job(stats, job):
+    # Статистика заданий после enqueue: только что созданное задание учитывается без повторного запроса
+    if stats['created'] is not None and job.created_at <= stats['created']:
+        return stats
+    return {**stats, 'jobs': stats['jobs'] + 1, 'created': job.created_at,
+            'progress': (stats['progress'] or 0) + job.progress}
+
+
+def page_version(scope, *stats):
+    # (ETag, Last-Modified) страницы; scope отличает страницы с одинаковыми данными (номер работы, урок, top_k)
+    digest = hashlib.sha256(repr((scope, [sorted(item.items()) for item in stats])).encode())
+    timestamps = [value for item in stats for value in item.values() if isinstance(value, datetime)]
+    return digest.hexdigest()[:32], max(timestamps, default=None)
+
+
+def not_modified(request, version):
+    # 304, если у клиента уже есть эта версия страницы, иначе None
+    etag, last_modified = version
+    response = get_conditional_response(request, etag=quote_etag(etag),
+                                        last_modified=int(last_modified.timestamp()) if last_modified else None)
+    return tag_response(response, version) if response is not None else None
+
+
+def tag_response(response, version):
+    etag, last_modified = version
+    response['ETag'] = quote_etag(etag)
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # браузер хранит страницу, но каждый раз сверяет версию
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def cached_fragment(name, version, render):
+    # Отрендеренный HTML фрагмента; render вызывается (и читает результаты) только при промахе
+    key = f'fragment:{name}:{version[0]}'
+    html = cache.get(key)
+    if html is None:
+        metrics.inc('fragment_cache_misses_total', fragment=name)
+        with metrics.timed('template_render', template=name):
+            html = render()
+        cache.set(key, html, FRAGMENT_TIMEOUT)
+    else:
+        metrics.inc('fragment_cache_hits_total', fragment=name)
+    return mark_safe(html)
@@ -0,0 +1,71 @@
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+from . import metrics
+from .similarity import as_artifact, compare_prepared
+
+logger = logging.getLogger(__name__)
+
+WORKERS = getattr(settings, 'PLAGIARISM_WORKERS', os.cpu_count() or 1)
+CHUNK_SIZE = getattr(settings, 'PLAGIARISM_CHUNK_SIZE', 64)
+
+# Состояние процесса пула: исходный код и уже подготовленные работы
+_codes = {}
+_prepared = {}
+_prepare = as_artifact
+_compare = compare_prepared
+
+
+def init_worker(codes, prepare, compare):
+    global _codes, _prepared, _prepare, _compare
+    _codes, _prepared, _prepare, _compare = codes, {}, prepare, compare
+
+
+def prepared(work_id):
+    # Каждая работа разбирается не больше одного раза на процесс
+    if work_id not in _prepared:
+        _prepared[work_id] = _prepare(_codes[work_id])
+    return _prepared[work_id]
+
+
+def compare_chunk(chunk):
+    return [_compare(prepared(id1), prepared(id2)) for id1, id2 in chunk]
+
+
+def compare_chunk_with_metrics(chunk):
+    # Процесс пула отдаёт родителю и свои счётчики времени метрик
+    return compare_chunk(chunk), metrics.drain()
+
+
+def chunked(pairs, size):
+    return [pairs[start:start + size] for start in range(0, len(pairs), size)]
+
+
+def compare_pairs(codes, pairs, prepare=as_artifact, compare=compare_prepared, workers=None, chunk_size=None):
+    # Генератор (пара, результат) в порядке pairs; пары раздаются пулу процессов пачками
+    workers = workers or WORKERS
+    chunk_size = chunk_size or CHUNK_SIZE
+    pairs = list(pairs)
+    started = time.perf_counter()
+
+    if workers <= 1 or len(pairs) <= chunk_size:
+        init_worker(codes, prepare, compare)
+        for pair in pairs:
+            yield pair, compare_chunk([pair])[0]
+        init_worker({}, prepare, compare)
+    else:
+        chunks = chunked(pairs, chunk_size)
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=init_worker,
+                                 initargs=(codes, prepare, compare)) as executor:
+            for chunk, (chunk_results, counters) in zip(chunks, executor.map(compare_chunk_with_metrics, chunks)):
+                metrics.merge(counters)
+                yield from zip(chunk, chunk_results)
+
+    elapsed = time.perf_counter() - started
+    if pairs:
+        logger.info("Compared %d pairs in %.2fs with %d workers (%.1f pairs/s)",
+                    len(pairs), elapsed, workers, len(pairs) / elapsed if elapsed else 0)
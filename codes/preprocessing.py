@@ -0,0 +1,45 @@
+from . import metrics
+from .models import CodeArtifact, Work
+from .queries import load_codes
+from .similarity import Artifact, build_artifact, content_hash
+from .tokenizer import tokens_from_bytes, tokens_to_bytes
+
+
+def to_artifact(row):
+    return Artifact(row.code_hash, tokens_from_bytes(row.tokens), row.ast_signature)
+
+
+def get_artifacts(codes):
+    # codes: {id: код}
+    hashes = {obj_id: content_hash(code) for obj_id, code in codes.items()}
+    return artifacts_by_hash(hashes, lambda ids: codes)
+
+
+def get_work_artifacts(works):
+    # Код читается одним запросом и только для работ, у которых ещё нет артефакта
+    return artifacts_by_hash({work.id: work.code_hash for work in works}, lambda ids: load_codes(Work, ids))
+
+
+def artifacts_by_hash(hashes, load):
+    # Готовые артефакты читаются одним запросом, недостающие строятся и сохраняются
+    stored = {row.code_hash: to_artifact(row) for row in CodeArtifact.objects.filter(code_hash__in=set(hashes.values()))}
+
+    missing_ids = {}
+    for obj_id, code_hash in hashes.items():
+        if code_hash not in stored:
+            missing_ids.setdefault(code_hash, obj_id)
+    metrics.inc('artifact_cache_hits_total', len(stored))
+    metrics.inc('artifact_cache_misses_total', len(missing_ids))
+    codes = load(list(missing_ids.values())) if missing_ids else {}
+    missing = {code_hash: build_artifact(codes[obj_id]) for code_hash, obj_id in missing_ids.items()}
+    CodeArtifact.objects.bulk_create(
+        [CodeArtifact(code_hash=artifact.code_hash, tokens=tokens_to_bytes(artifact.tokens),
+                      ast_signature=artifact.ast_signature) for artifact in missing.values()],
+        ignore_conflicts=True)
+
+    stored.update(missing)
+    return {obj_id: stored[code_hash] for obj_id, code_hash in hashes.items()}
+
+
+def get_artifact(code):
+    return get_artifacts({None: code})[None]
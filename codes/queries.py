@@ -0,0 +1,17 @@
+from .models import Submission, Work
+
+
+# Выборки для страниц результатов: только нужные столбцы, код работ не загружается
+def works_for_results(work_number=''):
+    works = Work.objects.filter(work_number=work_number) if work_number else Work.objects.all()
+    return works.select_related('user').only('id', 'work_number', 'code_blob', 'user__username').order_by('id')
+
+
+def lesson_submissions(lesson_id):
+    return (Submission.objects.filter(lesson_id=lesson_id).select_related('student')
+            .only('id', 'lesson_id', 'submission_time', 'student', 'student__full_name').order_by('id'))
+
+
+def load_codes(model, ids):
+    # Код нужных объектов одним запросом, когда он действительно понадобился
+    return dict(model.objects.filter(id__in=ids).values_list('id', 'code_blob__code'))
@@ -0,0 +1,135 @@
+from django.db.models import Q
+
+from . import metrics
+from .models import Result, Work
+from .fingerprints import work_candidate_pairs, work_partners, submission_candidate_pairs
+from .parallel import compare_pairs
+from .preprocessing import get_work_artifacts
+from .jaccard import jaccard_pairs
+from .backends import get_backend
+from .matrix import SimilarityMatrix
+from .similarity import IDENTICAL_SIMILARITY, compare_structure
+
+BATCH_SIZE = 200
+
+
+def fill_result(result, similarity, work1, work2):
+    # similarity_percentage — LCS по токенам (аналог SequenceMatcher.ratio)
+    result.work_1_hash = work1.code_hash
+    result.work_2_hash = work2.code_hash
+    result.jaccard_similarity = similarity['jaccard_similarity']
+    result.lcs_similarity = similarity['lcs_similarity']
+    result.tree_similarity = similarity['tree_similarity']
+    result.similarity_percentage = similarity['lcs_similarity']
+    result.report = f"Similarity: {result.similarity_percentage}%"
+    return result
+
+
+def is_fresh(result, work1, work2):
+    return result.work_1_hash == work1.code_hash and result.work_2_hash == work2.code_hash
+
+
+RESULT_FIELDS = ['work_1_hash', 'work_2_hash', 'jaccard_similarity', 'lcs_similarity', 'tree_similarity',
+                 'similarity_percentage', 'report']
+
+
+def save_batch(batch):
+    # Разделяем до вставки: bulk_create проставляет pk, и новые строки иначе попали бы ещё и в UPDATE.
+    # Ту же пару мог только что записать другой воркер (задание работы и номера работы одновременно) — upsert
+    to_create = [result for result in batch if result.pk is None]
+    to_update = [result for result in batch if result.pk is not None]
+    Result.objects.bulk_create(to_create, update_conflicts=True, unique_fields=['work_1', 'work_2'],
+                               update_fields=RESULT_FIELDS)
+    Result.objects.bulk_update(to_update, RESULT_FIELDS)
+
+
+def store_results(pairs, cached, by_id, progress=None, source='works'):
+    # Пересчитывает только отсутствующие и устаревшие пары (параллельно) и записывает их пачками,
+    # чтобы прогресс и уже готовые результаты были видны до конца расчёта
+    results, pending, batch = {}, [], []
+    for id1, id2 in pairs:
+        result = cached.get((id1, id2))
+        if result is not None and is_fresh(result, by_id[id1], by_id[id2]):
+            results[id1, id2] = result
+        elif by_id[id1].code_hash == by_id[id2].code_hash:
+            result = result or Result(work_1_id=id1, work_2_id=id2)
+            results[id1, id2] = fill_result(result, dict(IDENTICAL_SIMILARITY), by_id[id1], by_id[id2])
+            batch.append(result)
+        else:
+            pending.append((id1, id2))
+
+    metrics.inc('result_cache_hits_total', len(pairs) - len(pending) - len(batch))
+    metrics.inc('pairs_compared_total', len(pending), source=source)
+    artifacts = get_work_artifacts([by_id[work_id] for work_id in {work_id for pair in pending for work_id in pair}])
+    with metrics.timed('similarity_metric', metric='jaccard'):
+        jaccard = jaccard_pairs({work_id: artifact.token_set for work_id, artifact in artifacts.items()}, pending)
+    for (id1, id2), similarity in compare_pairs(artifacts, pending, compare=compare_structure):
+        similarity['jaccard_similarity'] = round(jaccard[id1, id2], 2)
+        result = cached.get((id1, id2)) or Result(work_1_id=id1, work_2_id=id2)
+        results[id1, id2] = fill_result(result, similarity, by_id[id1], by_id[id2])
+        batch.append(result)
+        if len(batch) >= BATCH_SIZE:
+            save_batch(batch)
+            batch = []
+            if progress:
+                progress(len(results), len(pairs))
+    save_batch(batch)
+    if progress:
+        progress(len(results), len(pairs))
+    return [results[pair] for pair in pairs]
+
+
+def sync_work_results(works, progress=None):
+    # Результаты для набора работ: сохранённые читаются одним запросом, считаются только новые пары
+    works = list(works)
+    by_id = {work.id: work for work in works}
+    pairs = sorted(work_candidate_pairs(works))
+    cached = {(result.work_1_id, result.work_2_id): result
+              for result in Result.objects.filter(work_1_id__in=by_id, work_2_id__in=by_id)}
+    return store_results(pairs, cached, by_id, progress)
+
+
+def update_work_results(work, progress=None):
+    # Пересчёт после загрузки или изменения одной работы: только пары с её участием
+    others = Work.objects.filter(work_number=work.work_number).exclude(id=work.id).only('id', 'code_blob')
+    partners = work_partners(work, others)
+    by_id = {other.id: other for other in others.filter(id__in=partners)}
+    by_id[work.id] = work
+
+    pairs = sorted(tuple(sorted((work.id, other_id))) for other_id in partners)
+    own_results = Result.objects.filter(Q(work_1=work) | Q(work_2=work))
+    own_results.exclude(Q(work_1_id__in=partners) | Q(work_2_id__in=partners)).delete()
+    cached = {(result.work_1_id, result.work_2_id): result for result in own_results}
+    return store_results(pairs, cached, by_id, progress)
+
+
+def work_results(works):
+    # Только чтение: готовые результаты, посчитанные для текущих версий кода
+    by_id = {work.id: work for work in works}
+    return [result for result in Result.objects.filter(work_1_id__in=by_id, work_2_id__in=by_id)
+            if is_fresh(result, by_id[result.work_1_id], by_id[result.work_2_id])]
+
+
+def compare_submissions(submissions, progress=None):
+    # Попарная схожесть отправок урока: {(id1, id2): процент}, расчёт — в выбранном бэкенде
+    by_id = {sub.id: sub for sub in submissions}
+    pairs = sorted(submission_candidate_pairs(list(by_id.values())))
+    similarities = {pair: 100.0 for pair in pairs if by_id[pair[0]].code_hash == by_id[pair[1]].code_hash}
+    pending = [pair for pair in pairs if pair not in similarities]
+    texts = {sub_id: by_id[sub_id].code for pair in pending for sub_id in pair}
+    metrics.inc('pairs_compared_total', len(pending), source='lesson')
+    similarities.update(get_backend().ratios(texts, pending))
+    if progress:
+        progress(len(similarities), len(pairs))
+    return similarities
+
+
+def compare_lesson(submissions, progress=None):
+    # Матрица урока по id студентов; сравнения студента с самим собой (повторные отправки) не учитываются
+    student_of = {sub.id: sub.student_id for sub in submissions}
+    values = {}
+    for (id1, id2), similarity in compare_submissions(submissions, progress).items():
+        key = student_of[id1], student_of[id2]
+        if key[0] != key[1]:
+            values[key] = max(similarity, values.get(key, similarity))
+    return SimilarityMatrix(sorted(set(student_of.values())), values)
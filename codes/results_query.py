@@ -0,0 +1,87 @@
+import csv
+import json
+import base64
+
+from django.db.models import F, Q
+
+from .models import Result
+
+SORT_FIELDS = ('similarity_percentage', 'jaccard_similarity', 'lcs_similarity', 'tree_similarity')
+ROW_FIELDS = ('id', 'work_1_id', 'work_1__user__username', 'work_2_id', 'work_2__user__username',
+              'jaccard_similarity', 'lcs_similarity', 'tree_similarity', 'similarity_percentage')
+CSV_HEADER = ('work_1_id', 'work_1_user', 'work_2_id', 'work_2_user',
+              'jaccard_similarity', 'lcs_similarity', 'tree_similarity', 'similarity_percentage')
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 2000
+
+
+def results_queryset(work_number='', sort='similarity_percentage', descending=True, min_similarity=None):
+    # Только актуальные результаты (хэши кода совпадают), отсортированные по метрике и id
+    results = Result.objects.filter(work_1_hash=F('work_1__code_blob'), work_2_hash=F('work_2__code_blob'))
+    if work_number:
+        results = results.filter(work_1__work_number=work_number, work_2__work_number=work_number)
+    if min_similarity is not None:
+        results = results.filter(**{f'{sort}__gte': min_similarity})
+    order = [f'-{sort}', '-id'] if descending else [sort, 'id']
+    return results.order_by(*order).values_list(*ROW_FIELDS)
+
+
+# Курсорная пагинация по ключу (значение метрики, id): страница не зависит от OFFSET
+def encode_cursor(value, result_id):
+    return base64.urlsafe_b64encode(json.dumps([value, result_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    # Курсор приходит от клиента: любая ошибка формата — ValueError (ответ 400)
+    try:
+        value, result_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(value), int(result_id)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+def paginate(results, sort, descending, cursor=None, limit=100):
+    # Размер страницы — от 1 до MAX_PAGE_SIZE: при limit < 1 курсор указывал бы на невыданную строку
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if cursor:
+        value, result_id = decode_cursor(cursor)
+        if descending:
+            results = results.filter(Q(**{f'{sort}__lt': value}) | Q(**{sort: value, 'id__lt': result_id}))
+        else:
+            results = results.filter(Q(**{f'{sort}__gt': value}) | Q(**{sort: value, 'id__gt': result_id}))
+
+    rows = list(results[:limit + 1])
+    page = [row_to_dict(row) for row in rows[:limit]]
+    last = rows[limit - 1] if len(rows) > limit else None
+    next_cursor = encode_cursor(last[ROW_FIELDS.index(sort)], last[0]) if last else None
+    return page, next_cursor
+
+
+def row_to_dict(row):
+    (result_id, work_1_id, work_1_user, work_2_id, work_2_user,
+     jaccard, lcs, tree, percentage) = row
+    return {
+        'id': result_id,
+        'work_1': {'id': work_1_id, 'user': work_1_user},
+        'work_2': {'id': work_2_id, 'user': work_2_user},
+        'similarity': {'jaccard_similarity': jaccard, 'lcs_similarity': lcs, 'tree_similarity': tree},
+        'similarity_percentage': percentage,
+    }
+
+
+# Потоковая выгрузка: строки читаются из БД кусками и сразу отдаются клиенту
+def stream_ndjson(results):
+    for row in results.iterator(chunk_size=STREAM_CHUNK_SIZE):
+        yield json.dumps(row_to_dict(row)) + '\n'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def stream_csv(results):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in results.iterator(chunk_size=STREAM_CHUNK_SIZE):
+        yield writer.writerow(row[1:])
@@ -0,0 +1,175 @@
+import ast
+import hashlib
+from collections import Counter
+from functools import cached_property
+
+from . import metrics
+from .tokenizer import tokenize_code
+
+
+class Artifact:
+    # Результат предобработки одной работы: считается один раз и переиспользуется всеми сравнениями.
+    # tokens — array('I') id токенов (codes.tokenizer)
+    def __init__(self, code_hash, tokens, ast_signature):
+        self.code_hash = code_hash
+        self.tokens = tokens
+        self.ast_signature = ast_signature
+
+    @cached_property
+    def token_set(self):
+        # Jaccard по n-граммам: после замены имён классами множество отдельных токенов почти одинаково у всех работ
+        return token_ngrams(self.tokens)
+
+    @cached_property
+    def subtrees(self):
+        return parse_signature(self.ast_signature)
+
+
+def content_hash(code):
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+def build_artifact(code):
+    metrics.inc('code_bytes_processed_total', len(code.encode()))
+    with metrics.timed('preprocess', stage='tokenize'):
+        tokens = tokenize_code(code)
+    with metrics.timed('preprocess', stage='ast'):
+        tree = normalize_code_with_ast(code)
+        signature = ast_signature(tree) if tree else ''
+    return Artifact(content_hash(code), tokens, signature)
+
+
+JACCARD_NGRAM = 3
+
+
+def pack(ngram):
+    return sum(token << (32 * i) for i, token in enumerate(ngram))
+
+
+def token_ngrams(tokens, n=JACCARD_NGRAM):
+    # Каждая n-грамма id токенов упакована в одно целое; короткая работа — одна «n-грамма» целиком
+    if len(tokens) < n:
+        return {pack(tokens)} if tokens else set()
+    return set(map(pack, zip(*(tokens[i:] for i in range(n)))))
+
+
+def as_artifact(value):
+    return value if isinstance(value, Artifact) else build_artifact(value)
+
+
+# Одинаковый код (равные SHA-256) сравнивать не нужно
+IDENTICAL_SIMILARITY = {'jaccard_similarity': 100.0, 'lcs_similarity': 100.0, 'tree_similarity': 100.0}
+
+
+def compare_prepared(artifact1, artifact2):
+    with metrics.timed('similarity_metric', metric='jaccard'):
+        jaccard = round(jaccard_similarity(artifact1.token_set, artifact2.token_set), 2)
+    return {'jaccard_similarity': jaccard, **compare_structure(artifact1, artifact2)}
+
+
+def compare_structure(artifact1, artifact2):
+    # Метрики, которые считаются только попарно; Jaccard для пачки пар считается векторно (codes.jaccard)
+    with metrics.timed('similarity_metric', metric='lcs'):
+        lcs = round(lcs_similarity(artifact1.tokens, artifact2.tokens), 2)
+    with metrics.timed('similarity_metric', metric='tree'):
+        tree = round(subtree_similarity(artifact1.subtrees, artifact2.subtrees), 2)
+    return {'lcs_similarity': lcs, 'tree_similarity': tree}
+
+
+def lcs_length(x, y):
+    # Битово-параллельный LCS (Hyyrö): одна строка DP хранится в битах целого числа,
+    # поэтому память линейна, а рекурсии и срезов строк нет.
+    # Общие префикс и суффикс входят в LCS целиком — отрезаем их заранее
+    prefix = 0
+    limit = min(len(x), len(y))
+    while prefix < limit and x[prefix] == y[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and x[-1 - suffix] == y[-1 - suffix]:
+        suffix += 1
+    x, y = x[prefix:len(x) - suffix], y[prefix:len(y) - suffix]
+
+    if len(x) < len(y):
+        x, y = y, x
+    if not y:
+        return prefix + suffix
+
+    masks = {}
+    for i, item in enumerate(x):
+        masks[item] = masks.get(item, 0) | (1 << i)
+
+    full = (1 << len(x)) - 1
+    row = full
+    for item in y:
+        matches = row & masks.get(item, 0)
+        row = ((row + matches) | (row - matches)) & full
+    return prefix + suffix + len(x) - row.bit_count()
+
+
+def lcs_similarity(x, y):
+    # Длина LCS, нормированная на суммарную длину последовательностей, в процентах
+    total = len(x) + len(y)
+    return 2 * lcs_length(x, y) / total * 100 if total else 0
+
+
+def jaccard_similarity(set1, set2):
+    intersection = len(set1 & set2)
+    union = len(set1 | set2)
+    return (intersection / union) * 100 if union else 0
+
+
+def normalize_code_with_ast(code):
+    # Комментарии в AST не попадают, поэтому текст разбирается без предварительных проходов регулярками
+    try:
+        return ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+
+
+def compare_trees(tree1, tree2):
+    if not tree1 or not tree2:
+        return 0
+    return subtree_similarity(subtree_hashes(tree1), subtree_hashes(tree2))
+
+
+# Структурное сравнение: мультимножество канонических хэшей поддеревьев.
+# В хэш входят только типы узлов, поэтому имена и литералы абстрагированы,
+# а вставка одного оператора меняет лишь хэши его предков.
+MIN_SUBTREE_SIZE = 3  # листья и пары узлов совпадают почти у любых двух программ
+
+
+def subtree_hashes(tree):
+    hashes = Counter()
+    done = {}  # id(узла) -> (хэш, размер поддерева); узлы-операторы (ast.Lt и т. п.) — общие объекты, поэтому без pop
+    stack = [(tree, False)]
+    while stack:
+        node, visited = stack.pop()
+        children = [child for child in ast.iter_child_nodes(node) if not isinstance(child, ast.expr_context)]
+        if not visited:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(children))
+            continue
+
+        child_info = [done[id(child)] for child in children]
+        canonical = f"{type(node).__name__}({','.join(h for h, _ in child_info)})"
+        node_hash = hashlib.blake2b(canonical.encode(), digest_size=8).hexdigest()
+        size = 1 + sum(child_size for _, child_size in child_info)
+        done[id(node)] = node_hash, size
+        if size >= MIN_SUBTREE_SIZE:
+            hashes[node_hash] += 1
+    return hashes
+
+
+def ast_signature(tree):
+    # Компактная запись мультимножества для хранения: "хэш:количество" через пробел
+    return ' '.join(f'{h}:{count}' for h, count in sorted(subtree_hashes(tree).items()))
+
+
+def parse_signature(signature):
+    return Counter({h: int(count) for h, count in (part.split(':') for part in signature.split())})
+
+
+def subtree_similarity(hashes1, hashes2):
+    # Пересечение мультимножеств, нормированное на их суммарный размер, в процентах
+    total = sum(hashes1.values()) + sum(hashes2.values())
+    return 2 * sum((hashes1 & hashes2).values()) / total * 100 if total else 0
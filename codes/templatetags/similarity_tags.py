@@ -0,0 +1,9 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def percent(value):
+    # Форматирование ячейки матрицы: 12.34% или "-", если пара не сравнивалась
+    return '-' if value is None else f"{value:.2f}%"
@@ -1 +1,785 @@
+import ast
+import os
+import re
+import json
+import random
+import io
+import base64
+import zipfile
+import tempfile
+import time
+from io import StringIO
+from array import array
+from datetime import timedelta
+from itertools import combinations
+from unittest import mock, skipUnless
 
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.conf import settings
+from django.db import connection, router
+from django.db.migrations.executor import MigrationExecutor
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase, RequestFactory, AsyncClient, SimpleTestCase
+from django.utils import timezone
+
+from . import views
+from .benchmark import generate_corpus, generate_submissions
+from .results_cache import save_batch
+from .topk import top_k_pairs
+from .fingerprints import kgram_hashes, shared_fingerprint_counts, winnow, work_candidate_pairs, work_partners
+from database_router import replica_reads
+from . import backends, compression, jaccard, jobs, minhash
+from .jobs import enqueue_work_number
+from .models import CodeBlob, User, Work, Lesson, Student, Submission, Result, ComparisonJob, CodeArtifact, Fingerprint
+from .similarity import compare_trees, jaccard_similarity, lcs_length, lcs_similarity, subtree_hashes
+
+
+class ResultsQueryCountTests(TestCase):
+    # Число запросов страниц результатов не должно зависеть от размера группы
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def create_works(self, count):
+        # часть работ списана: без похожих пар страница была бы пустой
+        for i, item in enumerate(generate_corpus(count, 30, plagiarism_rate=0.5, seed=count)):
+            user = User.objects.create(username=f'user{count}_{i}')
+            Work.objects.create(user=user, work_number=str(count), code=item['code'])
+
+    def create_lesson(self, count):
+        lesson = Lesson.objects.create(title=f'Lesson {count}')
+        for i, item in enumerate(generate_corpus(count, 30, plagiarism_rate=0.5, seed=count)):
+            student = Student.objects.create(full_name=f'Student {count}_{i}')
+            Submission.objects.create(student=student, lesson=lesson, code=item['code'])
+        return lesson
+
+    def prepare(self, view, params):
+        # первый запрос ставит задание в очередь, воркер считает результаты
+        view(self.factory.get('/', params))
+        call_command('run_comparison_worker', once=True, stdout=StringIO())
+
+    def test_app_results_queries_do_not_grow_with_works(self):
+        for count in (4, 12):
+            self.create_works(count)
+            params = {'work_number': str(count), 'all': '1'}
+            self.prepare(views.app_results, params)
+            with self.assertNumQueries(5):
+                response = views.app_results(self.factory.get('/', params))
+            self.assertEqual(response.status_code, 200)
+            # на странице — все посчитанные пары группы, а не пустая таблица
+            stored = set(Result.objects.filter(work_1__work_number=str(count))
+                         .values_list('work_1_id', 'work_2_id'))
+            rendered = re.findall(r'\(ID: (\d+)\)</td>\s*<td>[^<]*\(ID: (\d+)\)', response.content.decode())
+            self.assertTrue(stored)
+            self.assertEqual({(int(id1), int(id2)) for id1, id2 in rendered}, stored)
+            self.assertEqual(len(rendered), len(stored))
+
+    def test_results_matrix_queries_do_not_grow_with_submissions(self):
+        for count in (4, 12):
+            lesson = self.create_lesson(count)
+            params = {'lesson': lesson.id}
+            self.prepare(views.results, params)
+            with self.assertNumQueries(5):
+                response = views.results(self.factory.get('/', params))
+            self.assertEqual(response.status_code, 200)
+            # матрица count × count со всеми студентами урока и посчитанными процентами
+            content = response.content.decode()
+            for student in Student.objects.filter(submission__lesson=lesson):
+                self.assertIn(student.full_name, content)
+            cells = re.findall(r'<td>([^<]*)</td>', content)
+            self.assertEqual(len(cells), count * count)
+            self.assertTrue(any(cell.endswith('%') for cell in cells))
+
+    def get_if_none_match(self, params, etag):
+        return views.app_results(self.factory.get('/', params, HTTP_IF_NONE_MATCH=etag))
+
+    def test_unchanged_app_results_returns_not_modified(self):
+        self.create_works(4)
+        params = {'work_number': '4', 'all': '1'}
+        self.prepare(views.app_results, params)
+        response = views.app_results(self.factory.get('/', params))
+        self.assertEqual(response.status_code, 200)
+
+        # неизменившаяся страница: только запросы версии
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get_if_none_match(params, response['ETag']).status_code, 304)
+
+        work = Work.objects.filter(work_number='4').first()
+        work.code = work.code + '\nprint(1)\n'
+        work.save()
+        self.assertEqual(self.get_if_none_match(params, response['ETag']).status_code, 200)
+
+
+class DatabaseRouterTests(SimpleTestCase):
+    # Представления результатов читают с реплики, но ставят задания в очередь — запись должна идти в default
+
+    def setUp(self):
+        patcher = mock.patch.dict(settings.DATABASES, {'replica': settings.DATABASES['default']})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_results_are_read_from_replica_only_inside_replica_views(self):
+        self.assertEqual(router.db_for_read(Result), 'default')
+        with replica_reads():
+            for model in (Result, Work, Fingerprint, CodeArtifact):
+                self.assertEqual(router.db_for_read(model), 'replica')
+
+    def test_job_queue_is_read_from_primary(self):
+        with replica_reads():
+            self.assertEqual(router.db_for_read(ComparisonJob), 'default')
+
+    def test_writes_in_replica_views_go_to_primary(self):
+        with replica_reads():
+            for model in (ComparisonJob, Result, Fingerprint, CodeArtifact):
+                self.assertEqual(router.db_for_write(model), 'default')
+
+    def test_without_replica_everything_uses_default(self):
+        del settings.DATABASES['replica']
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Result), 'default')
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        for i, code in enumerate(generate_submissions(3, 30, seed=3)):
+            Work.objects.create(user=User.objects.create(username=f'queue{i}'), work_number='q', code=code)
+
+    def abandon(self, job):
+        # воркер упал: задание осталось running, отметок больше нет
+        ComparisonJob.objects.filter(id=job.id).update(
+            heartbeat_at=timezone.now() - timedelta(seconds=jobs.JOB_TIMEOUT + 1))
+
+    def test_abandoned_running_job_is_requeued(self):
+        job = enqueue_work_number('q')
+        self.assertEqual(jobs.claim_next_job(), job)
+        self.abandon(job)
+        self.assertEqual(enqueue_work_number('q'), job)  # новое задание не ставится
+
+        claimed = jobs.claim_next_job()
+        self.assertEqual((claimed, claimed.attempts), (job, 2))
+        self.assertEqual(jobs.run_job(claimed).status, 'done')
+
+    def test_job_fails_after_max_attempts(self):
+        job = enqueue_work_number('q')
+        jobs.claim_next_job()
+        ComparisonJob.objects.filter(id=job.id).update(attempts=jobs.MAX_JOB_ATTEMPTS)
+        self.abandon(job)
+        self.assertIsNone(jobs.claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_concurrent_enqueue_returns_existing_job(self):
+        job = enqueue_work_number('q')
+        # второй запрос проверил очередь до того, как первый создал задание
+        with mock.patch('codes.jobs.find_job', side_effect=[None, job]):
+            self.assertEqual(enqueue_work_number('q'), job)
+        self.assertEqual(ComparisonJob.objects.count(), 1)
+
+
+class JobHeartbeatTests(TransactionTestCase):
+    # Поток отметок пишет через своё соединение, поэтому тесту нужны настоящие коммиты
+
+    def test_running_job_without_progress_is_not_requeued(self):
+        work = Work.objects.create(user=User.objects.create(username='alice'), work_number='q', code='x = 1')
+        job = jobs.enqueue_work(work)
+        jobs.claim_next_job()
+        ComparisonJob.objects.filter(id=job.id).update(
+            heartbeat_at=timezone.now() - timedelta(seconds=jobs.JOB_TIMEOUT + 1))
+        stale = timezone.now() - timedelta(seconds=jobs.JOB_TIMEOUT)
+        with jobs.heartbeat(job, interval=0.01):
+            # долгий этап без отчётов о прогрессе: отметки идут из потока
+            for _ in range(100):
+                time.sleep(0.01)
+                job.refresh_from_db()
+                if job.heartbeat_at > stale:
+                    break
+            self.assertEqual(jobs.requeue_stale_jobs(), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('running', 1))
+
+
+class ResultsApiTests(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        works = [Work.objects.create(user=User.objects.create(username=f'api{i}'), work_number='api',
+                                     code=f'print({i})\n') for i in range(5)]
+        percentages = iter([90, 80, 80, 70, 70, 70, 50, 30, 10, 5])
+        for i, work1 in enumerate(works):
+            for work2 in works[i + 1:]:
+                percentage = next(percentages)
+                Result.objects.create(work_1=work1, work_2=work2, work_1_hash=work1.code_hash,
+                                      work_2_hash=work2.code_hash, similarity_percentage=percentage,
+                                      jaccard_similarity=100 - percentage, report='')
+
+    def get(self, **params):
+        return views.results_api(self.factory.get('/', {'work_number': 'api', **params}))
+
+    def pages(self, **params):
+        ids, cursor = [], None
+        while True:
+            data = json.loads(self.get(**params, **({'cursor': cursor} if cursor else {})).content)
+            ids.extend(row['id'] for row in data['results'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                return ids
+
+    def test_pages_follow_sort_order_without_gaps(self):
+        expected = list(Result.objects.order_by('-similarity_percentage', '-id').values_list('id', flat=True))
+        for limit in (1, 3, 4, 100, 0, -1):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.pages(limit=limit), expected)
+
+    def test_ascending_sort_by_other_metric(self):
+        expected = list(Result.objects.order_by('jaccard_similarity', 'id').values_list('id', flat=True))
+        self.assertEqual(self.pages(sort='jaccard_similarity', order='asc', limit=3), expected)
+
+    def test_min_similarity(self):
+        expected = list(Result.objects.filter(similarity_percentage__gte=70)
+                        .order_by('-similarity_percentage', '-id').values_list('id', flat=True))
+        self.assertEqual(self.pages(min_similarity=70, limit=2), expected)
+
+    def test_invalid_parameters_return_bad_request(self):
+        cursors = [base64.urlsafe_b64encode(value).decode() for value in (b'null', b'[1]', b'{}', b'["x", 1]')]
+        for params in [{'limit': 'ten'}, {'sort': 'id'}, {'cursor': '%%%'}] + [{'cursor': c} for c in cursors]:
+            with self.subTest(params=params):
+                self.assertEqual(self.get(**params).status_code, 400)
+
+
+class PlantedPairsTests(TestCase):
+    # Подброшенные списывания (переименование, перестановка функций) должны попадать в кандидаты и в Result
+
+    def create_works(self, language):
+        corpus = generate_corpus(30, 100, (language,), plagiarism_rate=0.3, seed=1)
+        works = [Work.objects.create(user=User.objects.create(username=f'{language}{i}'), work_number=language,
+                                     code=item['code']) for i, item in enumerate(corpus)]
+        planted = {tuple(sorted((works[i].id, works[item['source']].id)))
+                   for i, item in enumerate(corpus) if item['source'] is not None}
+        self.assertTrue(planted)
+        return works, planted
+
+    def test_planted_pairs_are_candidates(self):
+        for language in ('python', 'c', 'java'):
+            with self.subTest(language=language):
+                works, planted = self.create_works(language)
+                candidates = set(work_candidate_pairs(works))
+                self.assertLessEqual(planted, candidates)
+                # фильтр отсекает почти все несвязанные пары
+                self.assertLess(len(candidates), len(works) * (len(works) - 1) / 2 / 10)
+
+    def test_top_k_finds_planted_pairs_without_comparing_all_candidates(self):
+        works, planted = self.create_works('python')
+        # две копии одного оригинала похожи и между собой
+        families = {}
+        for id1, id2 in planted:
+            family = families.get(id1, {id1}) | families.get(id2, {id2})
+            families.update(dict.fromkeys(family, family))
+        related = {pair for family in families.values() for pair in combinations(sorted(family), 2)}
+        # без порога в кандидатах и несвязанные пары с общими отпечатками
+        candidates = work_candidate_pairs(works, min_ratio=0)
+        self.assertLess(related, set(candidates))
+        with mock.patch('codes.topk.work_candidate_pairs', lambda works: work_candidate_pairs(works, 0)):
+            top = top_k_pairs(works, len(related))
+        self.assertEqual({(result.work_1_id, result.work_2_id) for result in top}, related)
+        # пары с низкой долей общих отпечатков не сравнивались
+        self.assertLess(Result.objects.count(), len(candidates))
+
+    def test_planted_pairs_are_stored_by_worker(self):
+        works, planted = self.create_works('python')
+        enqueue_work_number('python')
+        call_command('run_comparison_worker', once=True, stdout=StringIO())
+        stored = set(Result.objects.values_list('work_1_id', 'work_2_id'))
+        self.assertLessEqual(planted, stored)
+
+
+class BulkUploadTests(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def post(self, body, content_type):
+        response = views.bulk_upload_works(self.factory.post('/', body, content_type=content_type))
+        return response.status_code, json.loads(response.content)
+
+    def test_ndjson_reports_errors_per_item(self):
+        lines = [
+            json.dumps({'user_name': 'alice', 'work_number': 'b1', 'code': 'print(1)\n'}),
+            '{broken',
+            '[1, 2]',
+            json.dumps({'user_name': 'bob', 'work_number': 'b1'}),
+            json.dumps({'user_name': 'carol', 'work_number': 'b1', 'code': 'print(2)\n', 'email': 'c@example.com'}),
+        ]
+        status, data = self.post('\n'.join(lines), 'application/x-ndjson')
+        self.assertEqual((status, data['status'], data['created'], data['failed']), (201, 'partial', 2, 3))
+        self.assertEqual([item['status'] for item in data['items']],
+                         ['created', 'error', 'error', 'error', 'created'])
+        self.assertIn('b1', data['jobs'])
+        self.assertEqual(set(Work.objects.values_list('user__username', flat=True)), {'alice', 'carol'})
+
+    def test_zip_reports_bad_entries_per_item(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr('lab1/alice.py', 'print(1)\n')
+            archive.writestr('lab1/bob.py', 'print(2)\n')
+            archive.writestr('lab1/carol.py', b'\xff\xfe')
+            archive.writestr('dave.py', 'print(4)\n')
+            archive.writestr('__MACOSX/lab1/._alice.py', 'x')
+            archive.writestr('lab1/erin.py', 'print(5)\n')
+        data = bytearray(buffer.getvalue())
+        data[data.find(b'print(2)')] = ord('q')  # CRC больше не совпадает
+        data[data.rfind(b'PK\x01\x02') + 8] |= 0x1  # последний файл помечен зашифрованным
+
+        status, response = self.post(bytes(data), 'application/zip')
+        self.assertEqual((status, response['created'], response['failed']), (201, 1, 4))
+        messages = [item.get('message') for item in response['items']]
+        self.assertEqual(messages, [None, 'lab1/bob.py: file is damaged', 'lab1/carol.py: file is not UTF-8 text',
+                                    'dave.py: work_number is not set', 'lab1/erin.py: file is encrypted'])
+
+    def test_invalid_archive_is_rejected(self):
+        status, data = self.post(b'not a zip', 'application/zip')
+        self.assertEqual((status, data['message']), (400, 'Invalid zip archive'))
+
+
+class CompareCorpusTests(TestCase):
+
+    def test_directory_is_compared_and_loaded(self):
+        codes = generate_submissions(3, 30, seed=1)
+        files = {'lab1/alice.py': codes[0], 'lab1/bob.py': codes[0].replace('total', 'result'),
+                 'lab1/carol.py': codes[0].replace('acc = 0', 'acc = 1', 1) + '\n' + codes[1][:200],
+                 'lab1/dave.py': b'\xff\xfe'}
+        with tempfile.TemporaryDirectory() as path:
+            os.mkdir(os.path.join(path, 'lab1'))
+            for name, code in files.items():
+                with open(os.path.join(path, name), 'wb') as file:
+                    file.write(code if isinstance(code, bytes) else code.encode())
+            output = os.path.join(path, 'out.ndjson')
+            call_command('compare_corpus', path, format='ndjson', output=output, workers=1, threshold=0,
+                         load=True, stderr=StringIO())
+            with open(output) as file:
+                rows = [json.loads(line) for line in file]
+
+        pairs = {(row['file_1'], row['file_2']): row['similarity_percentage'] for row in rows}
+        self.assertEqual(set(pairs), {('lab1/alice.py', 'lab1/bob.py'), ('lab1/alice.py', 'lab1/carol.py'),
+                                      ('lab1/bob.py', 'lab1/carol.py')})
+        self.assertEqual(pairs['lab1/alice.py', 'lab1/bob.py'], 100.0)
+        self.assertLess(pairs['lab1/alice.py', 'lab1/carol.py'], 100.0)
+        self.assertEqual(Work.objects.filter(work_number='lab1').count(), 3)
+        self.assertEqual(Result.objects.count(), 3)
+
+
+class ComparisonEventsTests(TestCase):
+
+    def create_works(self):
+        for i, code in enumerate(generate_submissions(4, 30, seed=4)):
+            Work.objects.create(user=User.objects.create(username=f'user{i}'), work_number='4', code=code)
+
+    async def test_finished_job_streams_progress_matches_and_done(self):
+        await sync_to_async(self.create_works)()
+        job = await sync_to_async(enqueue_work_number)('4')
+        await sync_to_async(call_command)('run_comparison_worker', once=True, stdout=StringIO())
+
+        response = await AsyncClient().get(f'/app/jobs/{job.id}/events/', SERVER_NAME='localhost')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = ''.join([chunk.decode() async for chunk in response.streaming_content])
+        events = [line.split(': ', 1)[1] for line in body.splitlines() if line.startswith('event: ')]
+        self.assertEqual(events, ['progress', 'matches', 'done'])
+        self.assertIn('"similarity_percentage"', body)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN format is SQLite-specific')
+class HotPathQueryPlanTests(TestCase):
+    # Горячие фильтры должны идти по индексам, а не полным сканированием таблиц
+
+    def assertUsesIndex(self, queryset, expected):
+        plan = queryset.explain()
+        self.assertIn(expected, plan)
+        for line in plan.splitlines():
+            self.assertIn('USING', line, f'full scan: {line}')
+
+    def test_work_number_filter(self):
+        self.assertUsesIndex(Work.objects.filter(work_number='1').order_by('upload_date'), 'work_number_upload_idx')
+
+    def test_lesson_submissions_filter(self):
+        self.assertUsesIndex(Submission.objects.filter(lesson_id=1).order_by('student_id'),
+                             'submission_lesson_student_idx')
+
+    def test_students_by_name(self):
+        self.assertUsesIndex(Student.objects.order_by('full_name'), 'student_full_name_idx')
+
+    def test_result_pair_lookup(self):
+        # SQLite хранит UniqueConstraint как автоиндекс таблицы, поэтому проверяются колонки поиска
+        self.assertUsesIndex(Result.objects.filter(work_1_id=1, work_2_id=2), '(work_1_id=? AND work_2_id=?)')
+
+
+class SubtreeHashTests(SimpleTestCase):
+    # CPython переиспользует узлы-операторы внутри дерева: один объект ast.Lt/ast.Add встречается много раз
+
+    def test_chained_comparison(self):
+        self.assertTrue(subtree_hashes(ast.parse('ok = a < b < c <= d')))
+
+    def test_repeated_binary_operators(self):
+        for code in ('x = a + b + c', 'x = (a + b) + (c + d)', 'x = (a * b) - (c * d) * e'):
+            with self.subTest(code=code):
+                self.assertTrue(subtree_hashes(ast.parse(code)))
+
+    def test_renamed_code_has_same_structure(self):
+        tree1 = ast.parse('if a < b < c:\n    total = (a + b) + (c + d)\n')
+        tree2 = ast.parse('if x < y < z:\n    result = (x + y) + (z + w)\n')
+        self.assertEqual(compare_trees(tree1, tree2), 100)
+
+
+def reference_lcs(x, y):
+    # Классическое ДП O(n·m) — эталон для битово-параллельного lcs_length
+    row = [0] * (len(y) + 1)
+    for item in x:
+        previous = 0
+        for j, other in enumerate(y, 1):
+            previous, row[j] = row[j], previous + 1 if item == other else max(row[j], row[j - 1])
+    return row[-1]
+
+
+class LcsTests(SimpleTestCase):
+
+    def test_matches_reference_on_random_sequences(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            alphabet = rng.randint(1, 6)
+            x = array('I', (rng.randrange(alphabet) for _ in range(rng.randint(0, 80))))
+            y = array('I', (rng.randrange(alphabet) for _ in range(rng.randint(0, 80))))
+            with self.subTest(x=list(x), y=list(y)):
+                self.assertEqual(lcs_length(x, y), reference_lcs(x, y))
+
+    def test_common_prefix_and_suffix(self):
+        cases = [
+            ('abcxyz', 'abcxyz'),
+            ('abcxyz', 'abcqyz'),
+            ('abc', 'abcabc'),
+            ('abcabc', 'abc'),
+            ('aaaa', 'aa'),
+            ('abxba', 'abyba'),
+            ('ab', 'ba'),
+        ]
+        for x, y in cases:
+            with self.subTest(x=x, y=y):
+                self.assertEqual(lcs_length(x, y), reference_lcs(x, y))
+                self.assertEqual(lcs_length(y, x), reference_lcs(x, y))
+
+    def test_empty_inputs(self):
+        self.assertEqual(lcs_length('', ''), 0)
+        self.assertEqual(lcs_length('abc', ''), 0)
+        self.assertEqual(lcs_length(array('I'), array('I', [1, 2])), 0)
+        self.assertEqual(lcs_similarity('', ''), 0)
+        self.assertEqual(lcs_similarity('abc', 'abc'), 100)
+
+
+class WinnowingTests(SimpleTestCase):
+
+    def test_selects_rightmost_minimum_of_each_window(self):
+        # пример из статьи Schleimer et al. (2003), окно 4
+        hashes = [77, 74, 42, 17, 98, 50, 17, 98, 8, 88, 67, 39, 77, 74, 42, 17, 98]
+        self.assertEqual(winnow(hashes, 4), [(17, 3), (17, 6), (8, 8), (39, 11), (17, 15)])
+
+    def test_every_window_contains_a_fingerprint(self):
+        rng = random.Random(0)
+        for window in (1, 2, 4, 7):
+            hashes = [rng.randrange(20) for _ in range(60)]
+            positions = [pos for h, pos in winnow(hashes, window)]
+            with self.subTest(window=window):
+                self.assertEqual(positions, sorted(set(positions)))
+                for h, pos in winnow(hashes, window):
+                    self.assertEqual(hashes[pos], h)
+                for start in range(len(hashes) - window + 1):
+                    self.assertTrue(any(start <= pos < start + window for pos in positions))
+
+    def test_short_inputs(self):
+        self.assertEqual(winnow([], 4), [])
+        self.assertEqual([h for h, pos in winnow([5, 3, 3], 4)], [3])
+        self.assertEqual(kgram_hashes(array('I'), 5), [])
+        self.assertEqual(len(kgram_hashes(array('I', [1, 2]), 5)), 1)
+        self.assertEqual(len(kgram_hashes(array('I', range(8)), 5)), 4)
+
+    def test_shared_fingerprint_counts(self):
+        # повтор хэша у одного владельца считается один раз
+        rows = [(1, 10), (1, 11), (2, 10), (2, 11), (2, 10), (3, 12)]
+        counts, sizes = shared_fingerprint_counts(rows, 3)
+        self.assertEqual(dict(counts), {(10, 11): 2})
+        self.assertEqual(dict(sizes), {10: 2, 11: 2, 12: 1})
+
+    def test_common_fingerprints_are_ignored(self):
+        # хэш шаблонного кода есть у всех 30 работ и не даёт кандидатов
+        rows = [(1, owner) for owner in range(30)] + [(2, 3), (2, 4)]
+        counts, sizes = shared_fingerprint_counts(rows, 30)
+        self.assertEqual(dict(counts), {(3, 4): 1})
+        self.assertEqual(dict(sizes), {3: 1, 4: 1})
+
+
+class CandidatePairsTests(TestCase):
+
+    def create_work(self, name, code):
+        return Work.objects.create(user=User.objects.create(username=name), work_number='lab', code=code)
+
+    def test_copies_are_candidates_and_unrelated_works_are_not(self):
+        code = generate_submissions(1, 60, seed=1)[0]
+        original = self.create_work('alice', code)
+        copy = self.create_work('bob', code.replace('acc', 'total'))
+        other = self.create_work('carol', (
+            "class Stack:\n"
+            "    def __init__(self):\n"
+            "        self.items = []\n\n"
+            "    def push(self, item):\n"
+            "        self.items.append(item)\n\n"
+            "    def pop(self):\n"
+            "        return self.items.pop() if self.items else None\n\n"
+            "    def __len__(self):\n"
+            "        return len(self.items)\n"))
+        # у несвязанных работ есть общие конструкции (def ID ( ID ) :), но это малая доля отпечатков
+        pairs = work_candidate_pairs([original, copy, other])
+        self.assertIn((original.id, copy.id), pairs)
+        self.assertNotIn((original.id, other.id), pairs)
+        self.assertNotIn((copy.id, other.id), pairs)
+
+    def test_work_partners_match_candidate_pairs(self):
+        corpus = generate_corpus(30, 100, ('python',), plagiarism_rate=0.3, seed=1)
+        works = [self.create_work(f'user{i}', item['code']) for i, item in enumerate(corpus)]
+        pairs = work_candidate_pairs(works)
+        for work in works:
+            expected = {id1 if id2 == work.id else id2 for id1, id2 in pairs if work.id in (id1, id2)}
+            with self.subTest(work=work.id):
+                self.assertEqual(set(work_partners(work, Work.objects.exclude(id=work.id))), expected)
+
+    def test_short_identical_works_are_candidates(self):
+        # у короткой работы один отпечаток, и он общий
+        first = self.create_work('alice', 'x = 1')
+        second = self.create_work('bob', 'x = 1')
+        self.assertEqual(set(work_candidate_pairs([first, second])), {(first.id, second.id)})
+
+
+@skipUnless(jaccard.np is not None and jaccard.sparse is not None, 'NumPy and SciPy are not installed')
+class SparseJaccardTests(SimpleTestCase):
+    # Разреженный расчёт должен совпадать с поэлементным по множествам
+
+    def setUp(self):
+        rng = random.Random(0)
+        self.token_sets = {obj_id: set(rng.sample(range(40), rng.randint(0, 25))) for obj_id in range(1, 16)}
+        self.token_sets[16] = set()
+
+    def test_pairs_match_set_jaccard(self):
+        pairs = [(id1, id2) for id1 in self.token_sets for id2 in self.token_sets if id1 < id2]
+        for (id1, id2), value in jaccard.jaccard_pairs(self.token_sets, pairs).items():
+            with self.subTest(pair=(id1, id2)):
+                self.assertAlmostEqual(value, jaccard_similarity(self.token_sets[id1], self.token_sets[id2]))
+
+    def test_matrix_matches_set_jaccard(self):
+        sets = list(self.token_sets.values())
+        matrix = jaccard.jaccard_matrix(sets)
+        for i, set1 in enumerate(sets):
+            for j, set2 in enumerate(sets):
+                self.assertAlmostEqual(matrix[i][j], jaccard_similarity(set1, set2))
+
+    def test_without_numpy_falls_back_to_sets(self):
+        pairs = [(1, 2), (3, 16)]
+        with mock.patch.object(jaccard, 'np', None):
+            fallback = jaccard.jaccard_pairs(self.token_sets, pairs)
+        for pair, value in jaccard.jaccard_pairs(self.token_sets, pairs).items():
+            self.assertAlmostEqual(value, fallback[pair])
+        self.assertEqual(jaccard.jaccard_pairs(self.token_sets, []), {})
+
+
+@skipUnless(minhash.np is not None, 'NumPy is not installed')
+class MinHashTests(SimpleTestCase):
+    # Подписи хранятся в БД: векторная и поэлементная версии должны давать одно и то же
+
+    def test_numpy_signature_matches_pure_python(self):
+        codes = generate_submissions(3, 60, seed=3) + ['x = 1', '']
+        for code in codes:
+            with self.subTest(code=code[:20]):
+                signature = minhash.minhash_signature(code)
+                with mock.patch.object(minhash, 'np', None):
+                    self.assertEqual(minhash.minhash_signature(code), signature)
+                self.assertEqual(len(signature), minhash.NUM_PERMUTATIONS)
+
+    def test_estimate_similarity(self):
+        code1, code2 = generate_submissions(2, 60, seed=4)
+        signature = minhash.minhash_signature(code1)
+        self.assertEqual(minhash.estimate_similarity(signature, minhash.minhash_signature(code1)), 100)
+        self.assertLess(minhash.estimate_similarity(signature, minhash.minhash_signature(code2)), 100)
+
+
+class CompressedCodeTests(TestCase):
+
+    def stored_bytes(self, blob):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT code FROM codes_codeblob WHERE hash = %s', [blob.hash])
+            return bytes(cursor.fetchone()[0])
+
+    def test_round_trip(self):
+        for code in ('', 'x = 1', generate_submissions(1, 100)[0], 'print("Привет")\n' * 20):
+            with self.subTest(code=code[:20]):
+                blob = CodeBlob.for_code(code)
+                blob.save()
+                self.assertEqual(CodeBlob.objects.get(hash=blob.hash).code, code)
+
+    def test_long_code_is_stored_compressed(self):
+        code = generate_submissions(1, 100)[0]
+        blob = CodeBlob.for_code(code)
+        blob.save()
+        method, dict_id = compression.HEADER.unpack_from(self.stored_bytes(blob))
+        self.assertEqual((method, dict_id), (compression.codec(), 0))
+        self.assertLess(len(self.stored_bytes(blob)), len(code))
+
+    def test_short_code_is_stored_raw(self):
+        blob = CodeBlob.for_code('x = 1')
+        blob.save()
+        self.assertEqual(self.stored_bytes(blob), compression.HEADER.pack(compression.RAW, 0) + b'x = 1')
+
+    def test_zlib_round_trip(self):
+        code = generate_submissions(1, 100)[0]
+        with mock.patch.object(compression, 'CODE_COMPRESSION', 'zlib'):
+            data = compression.compress(code)
+        self.assertEqual(data[0], compression.ZLIB)
+        self.assertEqual(compression.decompress(data), code)
+
+    @skipUnless(connection.vendor == 'sqlite', 'only SQLite keeps text values in a blob column')
+    def test_legacy_uncompressed_row(self):
+        code = 'def legacy():\n    return 1\n' * 5
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO codes_codeblob (hash, code, size, created_at) VALUES (%s, %s, %s, %s)',
+                           ['legacy', code, len(code), timezone.now()])
+        self.assertEqual(CodeBlob.objects.get(hash='legacy').code, code)
+
+
+class CompressCodeMigrationTests(TransactionTestCase):
+    # 0016 сжимает код существующих блобов и при откате возвращает его текстом
+    migrate_from = [('codes', '0015_code_blobs')]
+    migrate_to = [('codes', '0016_compressed_code_blobs')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_existing_code_is_compressed_and_restored(self):
+        code = generate_submissions(1, 100)[0]
+        apps = self.migrate(self.migrate_from)
+        apps.get_model('codes', 'CodeBlob').objects.create(hash='h', code=code, size=len(code))
+
+        apps = self.migrate(self.migrate_to)
+        self.assertEqual(apps.get_model('codes', 'CodeBlob').objects.get(hash='h').code, code)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT code FROM codes_codeblob WHERE hash = 'h'")
+            self.assertEqual(bytes(cursor.fetchone()[0])[0], compression.codec())
+
+        apps = self.migrate(self.migrate_from)
+        self.assertEqual(apps.get_model('codes', 'CodeBlob').objects.get(hash='h').code, code)
+
+
+class BackendTests(SimpleTestCase):
+
+    def test_difflib_is_default(self):
+        for name in (None, 'auto', 'difflib'):
+            with self.subTest(name=name):
+                self.assertEqual(backends.get_backend(name).name, 'difflib')
+
+    def test_rapidfuzz_is_opt_in(self):
+        with mock.patch.object(backends, 'SIMILARITY_BACKEND', 'rapidfuzz'):
+            if backends.fuzz is None:
+                self.assertRaises(ImportError, backends.get_backend)
+            else:
+                self.assertEqual(backends.get_backend().name, 'rapidfuzz')
+
+
+class DeleteUnusedCodeTests(TestCase):
+
+    def test_replaced_code_is_deleted(self):
+        work = Work.objects.create(user=User.objects.create(username='alice'), work_number='lab', code='x = 1')
+        old_hash = work.code_hash
+        CodeArtifact.objects.create(code_hash=old_hash, tokens=b'')
+        submission = Submission.objects.create(student=Student.objects.create(full_name='Alice'),
+                                               lesson=Lesson.objects.create(title='Lesson'), code='y = 2')
+        work.code = 'x = 2'
+        work.save()
+        CodeBlob.objects.update(created_at=timezone.now() - timedelta(days=2))
+
+        call_command('delete_unused_code', stdout=StringIO())
+        self.assertEqual(set(CodeBlob.objects.values_list('hash', flat=True)),
+                         {work.code_hash, submission.code_hash})
+        self.assertFalse(CodeArtifact.objects.filter(code_hash=old_hash).exists())
+
+    def test_recent_blobs_are_kept(self):
+        # блоб уже записан, а работа с ним ещё нет
+        CodeBlob.for_code('x = 1').save()
+        call_command('delete_unused_code', stdout=StringIO())
+        self.assertEqual(CodeBlob.objects.count(), 1)
+        call_command('delete_unused_code', min_age=0, stdout=StringIO())
+        self.assertEqual(CodeBlob.objects.count(), 0)
+
+
+class ResultsCacheTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(username='alice')
+        self.works = [Work.objects.create(user=user, work_number='lab', code=f'x = {i}') for i in range(3)]
+
+    def result(self, work1, work2, **fields):
+        return Result(work_1=work1, work_2=work2, work_1_hash=work1.code_hash, work_2_hash=work2.code_hash,
+                      similarity_percentage=50, **fields)
+
+    def test_new_results_are_inserted_once(self):
+        batch = [self.result(self.works[0], self.works[1]), self.result(self.works[0], self.works[2])]
+        with CaptureQueriesContext(connection) as queries:
+            save_batch(batch)
+        statements = [query['sql'].split()[0] for query in queries]
+        self.assertEqual(statements.count('INSERT'), 1)
+        self.assertNotIn('UPDATE', statements)
+        self.assertEqual(Result.objects.count(), 2)
+
+    def test_existing_results_are_updated(self):
+        result = self.result(self.works[0], self.works[1])
+        result.save()
+        result.similarity_percentage = 75
+        save_batch([result, self.result(self.works[1], self.works[2])])
+        self.assertEqual(Result.objects.get(pk=result.pk).similarity_percentage, 75)
+        self.assertEqual(Result.objects.count(), 2)
+
+    def test_result_written_by_another_worker_is_overwritten(self):
+        # другое задание записало пару после того, как это задание прочитало кэш
+        self.result(self.works[0], self.works[1]).save()
+        save_batch([self.result(self.works[0], self.works[1], lcs_similarity=90)])
+        self.assertEqual(Result.objects.get().lcs_similarity, 90)
+
+
+class ArchiveCheckTests(TestCase):
+
+    def setUp(self):
+        # код отличается только комментарием: все работы попадают в одни и те же корзины
+        code = generate_submissions(1, 60, seed=5)[0]
+        self.works = [Work.objects.create(user=User.objects.create(username=f'archive{i}'), work_number=str(i),
+                                          code=f'{code}\n# {i}\n') for i in range(6)]
+        minhash.index_minhash_bulk(self.works)
+
+    def test_similar_works_are_found(self):
+        matches = minhash.archive_check(self.works[0])
+        self.assertEqual({match['work_id'] for match in matches}, {work.id for work in self.works[1:]})
+
+    def test_oversized_buckets_are_skipped(self):
+        self.assertEqual(minhash.archive_check(self.works[0], max_bucket=3), [])
+
+
+class MetricsViewTests(SimpleTestCase):
+
+    def get(self, **extra):
+        return views.metrics_view(RequestFactory().get('/metrics/', REMOTE_ADDR='127.0.0.1', **extra))
+
+    def test_disabled_by_default(self):
+        self.assertEqual(self.get().status_code, 403)
+
+    def test_allowed_scraper(self):
+        with mock.patch.object(views, 'METRICS_ALLOWED_IPS', ['127.0.0.1']):
+            self.assertEqual(self.get().status_code, 200)
+            # запрос пришёл через локальный прокси
+            self.assertEqual(self.get(HTTP_X_FORWARDED_FOR='203.0.113.7').status_code, 403)
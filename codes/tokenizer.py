@@ -0,0 +1,117 @@
+import io
+import re
+import sys
+import zlib
+import keyword
+import tokenize
+from array import array
+
+# Имена заменяются классом: переименование переменных не меняет поток токенов. Литералы сохраняются —
+# без них k-граммы и LCS почти одинаковы у любых двух работ на одно задание
+IDENTIFIER = 'ID'
+STRING = 'STR'  # f-строки: их разбиение на токены зависит от версии Python, поэтому — одним классом
+
+C_KEYWORDS = frozenset('''
+    auto break case char const continue default do double else enum extern float for goto if inline int long
+    register restrict return short signed sizeof static struct switch typedef union unsigned void volatile while
+    bool true false nullptr class public private protected virtual template typename namespace using new delete
+    this throw try catch operator friend final abstract extends implements interface import package super
+    synchronized throws instanceof boolean byte null var
+'''.split())
+
+# Сканер C-подобных языков (C, C++, Java, JavaScript): один проход одним скомпилированным выражением
+C_TOKEN_RE = re.compile(r'''
+    (?P<skip>\s+|//[^\n]*|/\*.*?(?:\*/|\Z)|\#[^\n]*)
+  | (?P<string>"(?:\\.|[^"\\\n])*"?|'(?:\\.|[^'\\\n])*'?|`(?:\\.|[^`\\])*`?)
+  | (?P<number>(?:0[xX][0-9a-fA-F_]+|0[bB][01_]+|(?:\d[\d_]*\.?[\d_]*|\.\d[\d_]*)(?:[eE][+-]?\d+)?)[uUlLfFdD]*)
+  | (?P<name>[A-Za-z_$][\w$]*)
+  | (?P<op>>>>=|<<=|>>=|>>>|\.\.\.|->|::|\+\+|--|&&|\|\||<<|>>|[-+*/%&|^!=<>]=|[^\s\w])
+''', re.VERBOSE | re.DOTALL)
+
+PYTHON_LINE_END_RE = re.compile(r':[ \t]*(?:#.*)?$', re.MULTILINE)
+PYTHON_FSTRING_RE = re.compile(r'[rRbBuU]?[fF]')  # до Python 3.12 f-строка — один токен STRING
+
+PYTHON_SKIP = {tokenize.COMMENT, tokenize.NL, tokenize.ENCODING, tokenize.ENDMARKER}
+PYTHON_NAMES = {tokenize.INDENT: 'INDENT', tokenize.DEDENT: 'DEDENT', tokenize.NEWLINE: 'NEWLINE'}
+FSTRING_START = getattr(tokenize, 'FSTRING_START', None)  # Python 3.12+: f-строки разбиваются на части
+FSTRING_END = getattr(tokenize, 'FSTRING_END', None)
+
+_interned = {}
+
+
+def token_id(text):
+    # Стабильный id токена (crc32): одинаков во всех процессах, поэтому массивы можно хранить в БД
+    value = _interned.get(text)
+    if value is None:
+        value = _interned[text] = zlib.crc32(text.encode())
+    return value
+
+
+def detect_language(code):
+    # ';' и '{' — признак C-подобного языка, строки, оканчивающиеся на ':', — Python
+    c_like = code.count(';') + code.count('{')
+    return 'c' if c_like > len(PYTHON_LINE_END_RE.findall(code)) else 'python'
+
+
+def python_tokens(code):
+    tokens = []
+    fstring_depth = 0
+    for token in tokenize.generate_tokens(io.StringIO(code).readline):
+        kind = token.type
+        if fstring_depth:
+            fstring_depth += (kind == FSTRING_START) - (kind == FSTRING_END)
+        elif kind == FSTRING_START:
+            fstring_depth = 1
+            tokens.append(STRING)
+        elif kind in PYTHON_SKIP:
+            continue
+        elif kind == tokenize.NAME:
+            tokens.append(token.string if keyword.iskeyword(token.string) else IDENTIFIER)
+        elif kind == tokenize.STRING and PYTHON_FSTRING_RE.match(token.string):
+            tokens.append(STRING)
+        else:
+            tokens.append(PYTHON_NAMES.get(kind, token.string))
+    return tokens
+
+
+def c_tokens(code):
+    tokens = []
+    for match in C_TOKEN_RE.finditer(code):
+        kind = match.lastgroup
+        if kind == 'name':
+            text = match.group()
+            tokens.append(text if text in C_KEYWORDS else IDENTIFIER)
+        elif kind != 'skip':
+            tokens.append(match.group())
+    return tokens
+
+
+def token_strings(code, language=None):
+    language = language or detect_language(code)
+    if language == 'python':
+        try:
+            return python_tokens(code)
+        except (tokenize.TokenError, SyntaxError):
+            pass  # незакрытые скобки, ошибки отступов: разбираем общим сканером
+    return c_tokens(code)
+
+
+def tokenize_code(code, language=None):
+    # Работа как компактный массив uint32 id токенов
+    return array('I', map(token_id, token_strings(code, language)))
+
+
+# Хранение в БД: байты массива в порядке little-endian
+def tokens_to_bytes(tokens):
+    if sys.byteorder == 'big':
+        tokens = array('I', tokens)
+        tokens.byteswap()
+    return tokens.tobytes()
+
+
+def tokens_from_bytes(data):
+    tokens = array('I')
+    tokens.frombytes(bytes(data))
+    if sys.byteorder == 'big':
+        tokens.byteswap()
+    return tokens
@@ -0,0 +1,46 @@
+import heapq
+
+from django.conf import settings
+
+from .models import Result
+from .fingerprints import work_candidate_pairs
+from .results_cache import BATCH_SIZE, store_results
+
+TOP_K = getattr(settings, 'PLAGIARISM_TOP_K', 50)
+
+
+def top_k_pairs(works, k=TOP_K, progress=None):
+    # K самых похожих пар. Кандидаты идут пачками по убыванию доли общих отпечатков, точные метрики пачки
+    # считаются в пуле процессов (store_results). Перебор останавливается, когда доля у следующих пар
+    # ниже K-го найденного процента: оценка не строгая, но у списанных пар она близка к 100
+    if k <= 0:
+        return []
+    works = list(works)
+    by_id = {work.id: work for work in works}
+    candidates = work_candidate_pairs(works)
+    cached = {(result.work_1_id, result.work_2_id): result
+              for result in Result.objects.filter(work_1_id__in=by_id, work_2_id__in=by_id)}
+
+    ordered = sorted(candidates, key=lambda pair: (candidates[pair], pair), reverse=True)
+    best = []  # min-куча (score, pair, result) из K лучших
+    examined = 0
+    # первая пачка — K пар с наибольшей долей, дальше перебираются только пары с оценкой выше K-го результата
+    for start in [0, *range(k, len(ordered), BATCH_SIZE)]:
+        batch = ordered[start:start + (BATCH_SIZE if start else k)]
+        if len(best) == k:
+            batch = [pair for pair in batch if candidates[pair] * 100 > best[0][0]]
+            if not batch:
+                break  # у остальных пар оценка ещё ниже — K лучших уже известны
+        for result in store_results(batch, cached, by_id, source='top_k'):
+            item = (result.similarity_percentage, (result.work_1_id, result.work_2_id), result)
+            if len(best) < k:
+                heapq.heappush(best, item)
+            elif item[:2] > best[0][:2]:
+                heapq.heapreplace(best, item)
+        examined += len(batch)
+        if progress:
+            progress(examined, len(ordered))
+
+    if progress:
+        progress(len(ordered), len(ordered))
+    return [result for _, _, result in sorted(best, key=lambda item: item[:2], reverse=True)]
@@ -19,4 +19,22 @@ urlpatterns = [
 
     path('submit_code/', views.submit_code, name='submit_code'),
 
+    # JSON API результатов и потоковая выгрузка в CSV/NDJSON
+    path('results/api/', views.results_api, name='results_api'),
+    path('results/export/', views.results_export, name='results_export'),
+
+    # Массовая загрузка работ (NDJSON или zip)
+    path('upload/bulk/', views.bulk_upload_works, name='bulk_upload'),
+
+    # Очередь сравнений: запуск и статус задания
+    path('jobs/', views.start_comparison, name='start_comparison'),
+    path('jobs/<int:job_id>/', views.comparison_status, name='comparison_status'),
+    path('jobs/<int:job_id>/events/', views.comparison_events, name='comparison_events'),
+
+    # Поиск похожих работ в архиве прошлых семестров
+    path('archive_check/<int:work_id>/', views.archive_check_view, name='archive_check'),
+
+    # Метрики для сборщика (включаются PLAGIARISM_METRICS_ALLOWED_IPS)
+    path('metrics/', views.metrics_view, name='metrics'),
+
 ]
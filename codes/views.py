@@ -1,23 +1,37 @@
-import re
 import json
-import ast
-import difflib
-from functools import lru_cache
-from django.shortcuts import render
-from django.http import HttpResponse, JsonResponse
+
+from django.shortcuts import get_object_or_404
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import User
+from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 
-from .models import Submission, Work, Student
-from .forms import SubmissionForm, LessonSelectForm
+from .models import Work, ComparisonJob
+from .fingerprints import index_work
+from .preprocessing import get_artifact
+from .minhash import index_minhash, archive_check
+from .bulk_upload import BulkUploadError, parse_ndjson, parse_zip, bulk_upload
+from .results_cache import work_results
+from .results_query import SORT_FIELDS, results_queryset, paginate, stream_ndjson, stream_csv
+from .topk import TOP_K
+from .queries import works_for_results, lesson_submissions
+from .events import job_snapshot, job_events
+from .jobs import enqueue_work, enqueue_work_number, enqueue_lesson, latest_lesson_matrix, job_status
+from .forms import LessonSelectForm
+from . import metrics
+from .metrics import render_to_response
+from .page_cache import (work_number_stats, lesson_stats, work_number_jobs, lesson_jobs, job_stats, with_job,
+                         page_version, not_modified, tag_response, cached_fragment)
+from database_router import read_from_replica
 
 
 # Аутентификация через email
 def user_login(request):
     if request.method == 'POST':
         return handle_login(request)
-    return render(request, 'login.html')
+    return render_to_response(request, 'login.html')
 
 
 def handle_login(request):
@@ -31,7 +45,7 @@ def handle_login(request):
     return HttpResponse("Invalid credentials", status=403)
 
 
-# Парсинг запроса и нормализация кода
+# Парсинг запроса
 def parse_request_body(request):
     try:
         return json.loads(request.body)
@@ -39,92 +53,56 @@ def parse_request_body(request):
         return None
 
 
-def normalize_code(code):
-    # Убираем комментарии и спецсимволы
-    code = re.sub(r'//.*|#.*|/\*.*?\*/', '', code, flags=re.DOTALL)
-    code = re.sub(r'[\^\w\s{}();,]', '', code).lower().strip()
-    return re.sub(r'\s+', ' ', code)  # Приводим пробелы к одному
-
-
-# Сравнение кода
-def calculate_similarity(code1, code2):
-    return {
-        'jaccard_similarity': round(jaccard_similarity(set(code1.split()), set(code2.split())), 2),
-        'lcs_similarity': round(lcs_length(code1, code2), 2),
-        'tree_similarity': compare_trees(*map(normalize_code_with_ast, (code1, code2)))
-    }
-
-
-@lru_cache(maxsize=None)
-def lcs_length(x, y):
-    if not x or not y:
-        return 0
-    return 1 + lcs_length(x[:-1], y[:-1]) if x[-1] == y[-1] else max(lcs_length(x[:-1], y), lcs_length(x, y[:-1]))
-
-
-def jaccard_similarity(set1, set2):
-    intersection = len(set1 & set2)
-    union = len(set1 | set2)
-    return (intersection / union) * 100 if union else 0
-
-
-def normalize_code_with_ast(code):
-    code = re.sub(r'//.*|#.*', '', code)
-    code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
-    code = code.lower()
-    try:
-        return ast.parse(code)
-    except SyntaxError:
-        return None
-
-
-def compare_trees(tree1, tree2):
-    if not tree1 or not tree2:
-        return 0
-    score = 1 if type(tree1) == type(tree2) else 0
-    return score + sum(
-        compare_trees(c1, c2) for c1, c2 in zip(ast.iter_child_nodes(tree1), ast.iter_child_nodes(tree2)))
-
-
 # Представления
 
+@read_from_replica
 def results(request):
     lesson_id = request.GET.get('lesson')
-    students = Student.objects.all().order_by('full_name')
 
     if lesson_id:
-        submissions = Submission.objects.filter(lesson_id=lesson_id).select_related('student', 'lesson')
+        # версия страницы: отправки урока и состояние его заданий; без изменений — 304
+        stats, jobs = lesson_stats(lesson_id), job_stats(lesson_jobs(lesson_id))
+        version = page_version(('lesson', lesson_id), stats, jobs)
+        response = not_modified(request, version)
+        if response:
+            return response
+
+        submissions = list(lesson_submissions(lesson_id))
+        # сравнение выполняет воркер, страница показывает последнюю готовую матрицу
+        job = enqueue_lesson(lesson_id, submissions)
+        version = page_version(('lesson', lesson_id), stats, with_job(jobs, job))
     else:
-        submissions = Submission.objects.none()  # если нет lesson_id, то просто пустой набор
-
-    # создаем матрицу результатов
-    results_matrix = create_results_matrix(students, submissions)
+        submissions = []  # если нет lesson_id, то просто пустой набор
+        job = version = None
+
+    def render_matrix():
+        # в матрице только студенты, сдавшие работу по уроку
+        students = sorted({sub.student_id: sub.student for sub in submissions}.values(),
+                          key=lambda student: (student.full_name, student.id))
+        if not students:
+            return ''
+        matrix = latest_lesson_matrix(lesson_id)
+        return render_to_string('results_matrix.html', {
+            'students': students,
+            'results_matrix': create_results_matrix(students, matrix),
+        })
 
     # создаем форму для выбора урока
     form = LessonSelectForm(request.GET or None)
 
-    return render(request, 'app_results.html', {
+    response = render_to_response(request, 'app_results.html', {
         'form': form,
-        'results_matrix': results_matrix,
-        'students': students,
-        'submissions': submissions if lesson_id else None
+        'results_table': render_to_string('results_table.html', {'results': []}),
+        'results_matrix_table': cached_fragment('lesson_matrix', version, render_matrix) if version else '',
+        'submissions': submissions if lesson_id else None,
+        'job': job
     })
+    return tag_response(response, version) if version else response
 
 
-def create_results_matrix(students, submissions):
-    matrix = {student.full_name: {other.full_name: '-' for other in students} for student in students}
-
-    if not submissions:
-        return matrix  # если нет submissions, возвращаем пустую матрицу
-
-    for sub1 in submissions:
-        for sub2 in submissions:
-            if sub1 != sub2:
-                similarity = difflib.SequenceMatcher(None, sub1.code, sub2.code).ratio() * 100
-                matrix[sub1.student.full_name][sub2.student.full_name] = f"{similarity:.2f}%"
-
-    return matrix
-
+def create_results_matrix(students, matrix):
+    # строки таблицы генерируются при рендеринге, значения форматирует фильтр percent
+    return matrix.rows(students)
 
 
 # Работа с заданиями
@@ -144,7 +122,11 @@ def handle_work_upload(request):
         user = get_or_create_user(data)
         work = Work.objects.create(user=user, work_number=data['work_number'], code=data['code'],
                                    upload_date=data.get('upload_date'))
-        return JsonResponse({'status': 'success', 'work_id': work.id}, status=201)
+        index_work(work)
+        index_minhash(work)
+        get_artifact(work.code)
+        job = enqueue_work(work)
+        return JsonResponse({'status': 'success', 'work_id': work.id, 'job_id': job.id}, status=201)
 
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
@@ -156,6 +138,38 @@ def get_or_create_user(data):
     )[0]
 
 
+@csrf_exempt
+def bulk_upload_works(request):
+    if request.method == 'POST':
+        return handle_bulk_upload(request)
+    return JsonResponse({'status': 'error', 'message': 'Invalid method'}, status=405)
+
+
+def handle_bulk_upload(request):
+    # Пакет работ: NDJSON в теле запроса или zip-архив (файл archive либо тело application/zip)
+    try:
+        archive = request.FILES.get('archive')
+        if archive or request.content_type in ('application/zip', 'application/x-zip-compressed'):
+            items = parse_zip(archive or request.body, request.GET.get('work_number', ''))
+        else:
+            items = parse_ndjson(request)
+    except BulkUploadError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    if not items:
+        return JsonResponse({'status': 'error', 'message': 'Empty batch'}, status=400)
+
+    statuses, works = bulk_upload(items)
+    # одно задание на каждый номер работы вместо задания на каждую работу
+    jobs = {number: enqueue_work_number(number).id for number in sorted({work.work_number for work in works})}
+    return JsonResponse({
+        'status': 'success' if len(works) == len(items) else 'partial',
+        'created': len(works),
+        'failed': len(items) - len(works),
+        'jobs': jobs,
+        'items': statuses,
+    }, status=201 if works else 400)
+
+
 @csrf_exempt
 def update_work(request, work_id):
     if request.method == 'PUT':
@@ -172,7 +186,11 @@ def handle_work_update(request, work_id):
         work = Work.objects.get(id=work_id)
         work.code = data.get('code', work.code)
         work.save()
-        return JsonResponse({'status': 'success', 'work_id': work.id}, status=200)
+        index_work(work)
+        index_minhash(work)
+        get_artifact(work.code)
+        job = enqueue_work(work)
+        return JsonResponse({'status': 'success', 'work_id': work.id, 'job_id': job.id}, status=200)
 
     except Work.DoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'Work not found'}, status=404)
@@ -181,42 +199,174 @@ def handle_work_update(request, work_id):
 
 
 # Результаты загрузки работ
+@read_from_replica
 def app_results(request):
-    works = Work.objects.filter(work_number=request.GET.get('work_number')) if request.GET.get('work_number') else Work.objects.all()
-
+    work_number = request.GET.get('work_number', '')
+    # по умолчанию считаются и показываются только K самых похожих пар, ?all=1 — все пары
+    top_k = None if request.GET.get('all') else TOP_K
+
+    # версия страницы: работы с этим номером и состояние заданий; без изменений — 304
+    stats, jobs = work_number_stats(work_number), job_stats(work_number_jobs(work_number))
+    version = page_version(('work_number', work_number, top_k), stats, jobs)
+    response = not_modified(request, version)
+    if response:
+        return response
+
+    works = list(works_for_results(work_number))
     if not works:
         return HttpResponse("No works found.")
 
-    results = compare_work_results(works)
+    job = enqueue_work_number(work_number, top_k, works)
+    # задание могло быть поставлено только что — страница должна получить версию с ним
+    version = page_version(('work_number', work_number, top_k), stats, with_job(jobs, job))
+    results_table = cached_fragment('work_results', version, lambda: render_to_string(
+        'results_table.html', {'results': compare_work_results(works, top_k)}))
+
+    response = render_to_response(request, 'app_results.html', {'results_table': results_table, 'job': job})
+    return tag_response(response, version)
 
-    return render(request, 'app_results.html', {'results': results})
 
+def compare_work_results(works, limit=None):
+    works = list(works)
+    order = {work.id: i for i, work in enumerate(works)}
+    by_id = {work.id: work for work in works}
+
+    stored = work_results(works)
+    if limit:
+        stored = sorted(stored, key=lambda r: r.similarity_percentage, reverse=True)[:limit]
+    else:
+        stored = sorted(stored, key=lambda r: sorted((order[r.work_1_id], order[r.work_2_id])))
 
-def compare_work_results(works):
     results = []
-    for i in range(len(works)):
-        for j in range(i + 1, len(works)):
-            similarity = calculate_similarity(
-                works[i].code,
-                works[j].code
-            )
-            results.append({
-                'work_1': {'id': works[i].id, 'user': works[i].user},
-                'work_2': {'id': works[j].id, 'user': works[j].user},
-                'similarity': similarity  # передаем словарь с результатами сравнения
-            })
+    for result in stored:
+        work1, work2 = sorted((by_id[result.work_1_id], by_id[result.work_2_id]), key=lambda work: order[work.id])
+        results.append({
+            'work_1': {'id': work1.id, 'user': work1.user},
+            'work_2': {'id': work2.id, 'user': work2.user},
+            'similarity': result.similarity  # передаем словарь с результатами сравнения
+        })
     return results
 
 
+# API результатов: пагинация по курсору и потоковая выгрузка
+def parse_results_params(request):
+    sort = request.GET.get('sort', 'similarity_percentage')
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"Unknown sort field: {sort}")
+    min_similarity = request.GET.get('min_similarity')
+    return {
+        'work_number': request.GET.get('work_number', ''),
+        'sort': sort,
+        'descending': request.GET.get('order', 'desc') != 'asc',
+        'min_similarity': float(min_similarity) if min_similarity else None,
+    }
+
+
+@read_from_replica
+def results_api(request):
+    if request.method != 'GET':
+        return JsonResponse({'status': 'error', 'message': 'Invalid method'}, status=405)
+
+    try:
+        params = parse_results_params(request)
+        page, next_cursor = paginate(results_queryset(**params), params['sort'], params['descending'],
+                                     request.GET.get('cursor'), int(request.GET.get('limit', 100)))
+    except (TypeError, ValueError) as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    return JsonResponse({'results': page, 'next_cursor': next_cursor})
+
+
+@read_from_replica
+def results_export(request):
+    if request.method != 'GET':
+        return JsonResponse({'status': 'error', 'message': 'Invalid method'}, status=405)
+
+    try:
+        results = results_queryset(**parse_results_params(request))
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    if request.GET.get('format') == 'csv':
+        response = StreamingHttpResponse(stream_csv(results), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="results.csv"'
+        return response
+    return StreamingHttpResponse(stream_ndjson(results), content_type='application/x-ndjson')
+
+
+# Очередь сравнений
+@csrf_exempt
+def start_comparison(request):
+    if request.method == 'POST':
+        return handle_comparison_start(request)
+    return JsonResponse({'status': 'error', 'message': 'Invalid method'}, status=405)
+
+
+def handle_comparison_start(request):
+    data = parse_request_body(request)
+    if not data:
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON body'}, status=400)
+
+    if data.get('lesson'):
+        job = enqueue_lesson(data['lesson'])
+    else:
+        job = enqueue_work_number(data.get('work_number', ''))
+    return JsonResponse({'status': 'success', 'job_id': job.id}, status=202)
+
+
+def comparison_status(request, job_id):
+    if request.method != 'GET':
+        return JsonResponse({'status': 'error', 'message': 'Invalid method'}, status=405)
+    job = get_object_or_404(ComparisonJob, id=job_id)
+    return JsonResponse(job_status(job))
+
+
+# Проверка по архиву (MinHash/LSH)
+def archive_check_view(request, work_id):
+    if request.method != 'GET':
+        return JsonResponse({'status': 'error', 'message': 'Invalid method'}, status=405)
+    work = get_object_or_404(Work, id=work_id)
+    return JsonResponse({'work_id': work.id, 'matches': archive_check(work)})
+
+
+# Под ASGI Django сам выполняет синхронные представления в потоке (sync_to_async), отдельные async-копии
+# не нужны. Асинхронный только поток событий: он держит соединение, но не занимает поток на всё время задания
+
+async def comparison_events(request, job_id):
+    # Server-Sent Events: прогресс задания и лучшие найденные пары, пока задание не завершится
+    if request.method != 'GET':
+        return JsonResponse({'status': 'error', 'message': 'Invalid method'}, status=405)
+    if await job_snapshot(job_id) is None:
+        return JsonResponse({'status': 'error', 'message': 'Job not found'}, status=404)
+    response = StreamingHttpResponse(job_events(job_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx не должен буферизовать поток
+    return response
+
+
+# Метрики процесса для сборщика (формат Prometheus). По умолчанию выключены: за локальным обратным прокси
+# любой внешний запрос приходит с 127.0.0.1, поэтому адреса сборщика задаются явно, а сам он должен
+# обращаться к приложению напрямую, минуя прокси. Запросы с X-Forwarded-For (через прокси) отклоняются
+METRICS_ALLOWED_IPS = getattr(settings, 'PLAGIARISM_METRICS_ALLOWED_IPS', [])
+
+
+def metrics_view(request):
+    if request.method != 'GET':
+        return JsonResponse({'status': 'error', 'message': 'Invalid method'}, status=405)
+    if request.META.get('REMOTE_ADDR') not in METRICS_ALLOWED_IPS or 'HTTP_X_FORWARDED_FOR' in request.META:
+        return JsonResponse({'status': 'error', 'message': 'Forbidden'}, status=403)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 # Прочие представления
 def index(request):
-    return render(request, 'index.html')
+    return render_to_response(request, 'index.html')
 
 
 def app_upload(request):
-    return render(request, 'app_upload.html')
+    return render_to_response(request, 'app_upload.html')
 
 
 # Функция для обработки кода отправки
 def submit_code(request):
-    return render(request, 'submit_code.html')
+    return render_to_response(request, 'submit_code.html')
@@ -1,30 +1,78 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+# Модели, которые нельзя читать с реплики: состояние очереди заданий должно быть актуальным
+PRIMARY_ONLY_MODELS = {'comparisonjob'}
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads():
+    # Внутри блока чтение таблиц приложения идёт с реплики (если она настроена)
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def read_from_replica(view):
+    # Для представлений, которые читают результаты. Запись внутри них (постановка заданий в очередь)
+    # всё равно идёт в default: db_for_write не зависит от replica_reads, а ComparisonJob и читается
+    # с основной базы, чтобы задание, только что поставленное в очередь, было сразу видно
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            response = view(*args, **kwargs)
+        if getattr(response, 'streaming', False):
+            # потоковый ответ выполняет запросы уже после выхода из представления
+            response.streaming_content = stream_from_replica(response.streaming_content)
+        return response
+    return wrapper
+
+
+def stream_from_replica(content):
+    with replica_reads():
+        yield from content
+
+
 class DatabaseRouter:
     """
     Управление запросами между базами данных PostgreSQL и SQLite.
     """
+    def sqlite_alias(self):
+        return 'sqlite' if 'sqlite' in settings.DATABASES else 'default'
+
     def db_for_read(self, model, **hints):
         if model._meta.app_label == 'postgres_app':
             return 'default'
         elif model._meta.app_label == 'sqlite_app':
-            return 'sqlite'
+            return self.sqlite_alias()
+        if (_replica_reads.get() and 'replica' in settings.DATABASES
+                and model._meta.model_name not in PRIMARY_ONLY_MODELS):
+            return 'replica'
         return None
 
     def db_for_write(self, model, **hints):
-        if model._meta.app_label == 'postgres_app':
-            return 'default'
-        elif model._meta.app_label == 'sqlite_app':
-            return 'sqlite'
-        return None
+        if model._meta.app_label == 'sqlite_app':
+            return self.sqlite_alias()
+        return 'default'  # в том числе для объектов, прочитанных с реплики
 
     def allow_relation(self, obj1, obj2, **hints):
-        db_set = ('default', 'sqlite')
+        db_set = ('default', 'replica', 'sqlite')
         if obj1._state.db in db_set and obj2._state.db in db_set:
             return True
         return None
 
     def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == 'replica':
+            return False  # схема реплики приходит с основной базы
         if app_label == 'postgres_app':
             return db == 'default'
         elif app_label == 'sqlite_app':
-            return db == 'sqlite'
-        return None
+            return db == self.sqlite_alias()
+        return db == 'default'
@@ -1,4 +1,8 @@
 import os
+
 from django.core.asgi import get_asgi_application
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'plagiarism_checker.settings')
-asgi_application = get_asgi_application()
+
+# Серверы ASGI (uvicorn, daphne) ищут объект application
+application = get_asgi_application()
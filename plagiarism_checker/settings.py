@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -30,6 +31,7 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'codes.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,19 +66,58 @@ TEMPLATES = [
 
 
 WSGI_APPLICATION = 'plagiarism_checker.wsgi.application'
+ASGI_APPLICATION = 'plagiarism_checker.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',  # Путь к базе данных
-    }
+# Без POSTGRES_DB всё хранится в локальном SQLite (разработка и тесты).
+# С POSTGRES_DB основные таблицы (работы, отправки, результаты, отпечатки) живут в PostgreSQL,
+# а POSTGRES_REPLICA_HOST добавляет реплику для страниц и API результатов (см. database_router.py)
+SQLITE_DATABASE = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'db.sqlite3',  # Путь к базе данных
+    # воркеры ждут блокировку записи, а не падают с "database is locked"
+    'OPTIONS': {'timeout': 20, 'transaction_mode': 'IMMEDIATE'},
 }
 
 
+def postgres_database(host):
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['POSTGRES_DB'],
+        'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': host,
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        'CONN_HEALTH_CHECKS': True,
+    }
+    pool_size = int(os.environ.get('POSTGRES_POOL_SIZE', 0))
+    if pool_size:
+        # Пул соединений psycopg 3 (psycopg-pool в requirements.txt); с пулом CONN_MAX_AGE должен быть 0
+        database['OPTIONS'] = {'pool': {'min_size': 1, 'max_size': pool_size}}
+        database['CONN_MAX_AGE'] = 0
+    else:
+        # Постоянные соединения без пула: не открывать соединение на каждый запрос
+        database['CONN_MAX_AGE'] = int(os.environ.get('POSTGRES_CONN_MAX_AGE', 60))
+    return database
+
+
+if os.environ.get('POSTGRES_DB'):
+    DATABASES = {
+        'default': postgres_database(os.environ.get('POSTGRES_HOST', 'localhost')),
+        'sqlite': SQLITE_DATABASE,
+    }
+    if os.environ.get('POSTGRES_REPLICA_HOST'):
+        DATABASES['replica'] = {**postgres_database(os.environ['POSTGRES_REPLICA_HOST']),
+                                'TEST': {'MIRROR': 'default'}}
+else:
+    DATABASES = {
+        'default': SQLITE_DATABASE,
+    }
+
+
 
 
 